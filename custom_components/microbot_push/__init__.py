@@ -6,25 +6,8 @@ https://github.com/spycle/microbot_push
 """
 from __future__ import annotations
 import asyncio
-from datetime import timedelta
 import logging
-import re
-from typing import TYPE_CHECKING, Any
-
-from homeassistant.components import bluetooth
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import Config, HomeAssistant
-from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers.aiohttp_client import async_get_clientsession
-from homeassistant.core import HomeAssistant, ServiceCall, callback
-from homeassistant.components.bluetooth.passive_update_coordinator import (
-    PassiveBluetoothDataUpdateCoordinator,
-)
-from .api import MicroBotApiClient, parse_advertisement_data
-from .api import GetMicroBotDevices
-
-if TYPE_CHECKING:
-    from bleak.backends.device import BLEDevice
+from typing import TYPE_CHECKING
 
 from .const import (
     CONF_BDADDR,
@@ -34,8 +17,21 @@ from .const import (
     STARTUP_MESSAGE,
     CONF_RETRY_COUNT,
     DEFAULT_RETRY_COUNT,
+    CONF_PRECONNECT,
+    DEFAULT_PRECONNECT,
+    CONF_TRACE,
+    DEFAULT_TRACE,
+    DATA_TRACE,
+    DATA_USAGE,
+    TRACE_FILE,
 )
 
+if TYPE_CHECKING:
+    from homeassistant.config_entries import ConfigEntry
+    from homeassistant.core import Config, HomeAssistant
+
+USAGE_STORAGE_VERSION = 1
+
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
 
@@ -45,6 +41,18 @@ async def async_setup(hass: HomeAssistant, config: Config):
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up this integration using UI."""
+    # Home Assistant is only imported here so that the client modules can be
+    # used as a standalone library.
+    from homeassistant.components import bluetooth
+    from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+    from homeassistant.core import Event, ServiceCall, callback
+    from homeassistant.exceptions import ConfigEntryNotReady
+    from .api import MicroBotApiClient, token_path
+    from .coordinator import MicroBotDataUpdateCoordinator
+    from .discovery import DATA_DISCOVERY
+    from .scheduler import Priority
+    from .trace import TraceRecorder
+
     if hass.data.get(DOMAIN) is None:
         hass.data.setdefault(DOMAIN, {})
         _LOGGER.debug(STARTUP_MESSAGE)
@@ -61,16 +69,44 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
             f"Could not find MicroBot with address {bdaddr}"
         )
     name = entry.data.get(CONF_NAME)
-    conf_dir = hass.config.path()
-    conf = conf_dir+"/.storage/microbot-"+re.sub('[^a-f0-9]', '', bdaddr.lower())+".conf"
     client = MicroBotApiClient(
         device=ble_device,
-        config=conf,
+        config=token_path(hass.config.path(".storage"), bdaddr),
         retry_count=entry.options[CONF_RETRY_COUNT],
     )
     coordinator = MicroBotDataUpdateCoordinator(hass, client=client, ble_device=ble_device)
+    if (index := hass.data.get(DATA_DISCOVERY)) is not None and entry.unique_id:
+        index.async_mark_configured(entry.unique_id)
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
+    # Read the token file in the executor, without holding up setup.
+    hass.async_create_task(client.async_load())
+
+    if entry.options.get(CONF_PRECONNECT, DEFAULT_PRECONNECT):
+        # Kept across reloads, so a save still pending from the last run is
+        # cancelled when the entry is removed.
+        stores = hass.data.setdefault(DATA_USAGE, {})
+        if (store := stores.get(entry.entry_id)) is None:
+            store = stores[entry.entry_id] = _usage_store(hass, entry)
+        entry.async_on_unload(coordinator.async_start_preconnect(store))
+
+    if entry.options.get(CONF_TRACE, DEFAULT_TRACE):
+        if (recorder := hass.data.get(DATA_TRACE)) is None:
+            # One trace for all bots, so bursts across devices line up.
+            recorder = hass.data[DATA_TRACE] = TraceRecorder(hass.config.path(TRACE_FILE))
+
+            async def _flush_trace(event: Event) -> None:
+                await recorder.async_flush()
+
+            hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, _flush_trace)
+        coordinator.trace = recorder
+
+        @callback
+        def _stop_trace() -> None:
+            coordinator.trace = None
+            hass.async_create_task(recorder.async_flush())
+
+        entry.async_on_unload(_stop_trace)
 
     for platform in PLATFORMS:
         coordinator.platforms.append(platform)
@@ -81,7 +117,12 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     @callback
     async def generate_token(call: ServiceCall) -> None:
         _LOGGER.debug("Token service called")
-        await coordinator.api.connect(init=True)
+
+        async def _generate() -> bool:
+            await coordinator.api.connect(init=True)
+            return coordinator.api.is_connected()
+
+        await coordinator.async_run("generate_token", Priority.MAINTENANCE, _generate)
 
     @callback
     async def calibrate(call: ServiceCall) -> None:
@@ -89,61 +130,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         depth = call.data["depth"]
         duration = call.data["duration"]
         mode = call.data["mode"]
-        await coordinator.api.connect()
-        coordinator.api.setDepth(depth)
-        coordinator.api.setDuration(duration)
-        coordinator.api.setMode(mode)
-        await coordinator.api.calibrate()
-        await coordinator.api.disconnect()
+
+        async def _calibrate() -> bool:
+            await coordinator.api.connect()
+            coordinator.api.setDepth(depth)
+            coordinator.api.setDuration(duration)
+            coordinator.api.setMode(mode)
+            ok = await coordinator.api.calibrate()
+            await coordinator.api.disconnect()
+            return ok
+
+        await coordinator.async_run("calibrate", Priority.MAINTENANCE, _calibrate)
 
     hass.services.async_register(DOMAIN, 'generate_token', generate_token)
     hass.services.async_register(DOMAIN, 'calibrate', calibrate)
     entry.async_on_unload(entry.add_update_listener(async_reload_entry))
     return True
 
-class MicroBotDataUpdateCoordinator(PassiveBluetoothDataUpdateCoordinator):
-    """Class to manage fetching data from the MicroBot."""
-
-    def __init__(
-        self, hass: HomeAssistant, client: MicroBotApiClient, ble_device: BLEDevice,
-    ) -> None:
-        """Initialize."""
-        self.api = client
-        self.platforms = []
-        self._ready_event = asyncio.Event()
-        self.data: dict[str, Any] = {}
-        self.ble_device = ble_device
-
-        super().__init__(
-            hass, _LOGGER, ble_device.address, bluetooth.BluetoothScanningMode.ACTIVE
-        )
-
-    @callback
-    def _async_handle_bluetooth_event(
-        self,
-        service_info: bluetooth.BluetoothServiceInfoBleak,
-        change: bluetooth.BluetoothChange,
-    ) -> None:
-        """Handle a Bluetooth event."""
-        super()._async_handle_bluetooth_event(service_info, change)
-        if adv := parse_advertisement_data(
-            service_info.device, service_info.advertisement
-        ):
-            self.data = adv.data
-            if self.data:
-                self._ready_event.set()
-            _LOGGER.debug("%s: MicroBot data: %s", self.ble_device.address, self.data)
-            self.device.update_from_advertisement(adv)
-        self.async_update_listeners()
-
-    async def async_wait_ready(self) -> bool:
-        """Wait for the device to be ready."""
-        try:
-            await asyncio.wait_for(self._ready_event.wait(), timeout=55)
-        except asyncio.TimeoutError:
-            return False
-        return True
-
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Handle removal of an entry."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
@@ -162,6 +165,23 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return unloaded
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the learned usage and offer the device for discovery again."""
+    from .discovery import DATA_DISCOVERY
+
+    store = hass.data.get(DATA_USAGE, {}).pop(entry.entry_id, None)
+    await (store or _usage_store(hass, entry)).async_remove()
+    if (index := hass.data.get(DATA_DISCOVERY)) is not None and entry.unique_id:
+        index.async_mark_unconfigured(entry.unique_id)
+
+
+def _usage_store(hass: HomeAssistant, entry: ConfigEntry):
+    """Return the store holding the usage histogram of an entry."""
+    from homeassistant.helpers.storage import Store
+
+    return Store(hass, USAGE_STORAGE_VERSION, f"{DOMAIN}.usage.{entry.entry_id}")
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry."""
     await async_unload_entry(hass, entry)
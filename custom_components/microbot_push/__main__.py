@@ -0,0 +1,6 @@
+"""Run the MicroBot command line interface."""
+import sys
+
+from .cli import main
+
+sys.exit(main())
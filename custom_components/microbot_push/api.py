@@ -1,35 +1,76 @@
-"""MicroBot Client."""
+"""MicroBot Client.
+
+bleak and configparser are imported where they are used, so that loading
+the integration stays cheap.
+"""
 from __future__ import annotations
 import logging
 import asyncio
-from typing import Optional
-from typing import Any
-import struct
-import async_timeout
-import bleak
-from bleak import BleakScanner
-from bleak import discover
-from bleak import BleakError
-from bleak_retry_connector import BleakClient, establish_connection
-from bleak.backends.device import BLEDevice
-from bleak.backends.scanner import AdvertisementData
+from typing import TYPE_CHECKING, Any, Callable
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-import random, string
-import configparser
-from configparser import NoSectionError
 import os
 from os.path import expanduser
+import re
+import threading
+import time
 import binascii
-from binascii import hexlify, unhexlify
+from binascii import hexlify
+from .recorder import FrameRecorder, RX, TX
+from .scheduler import LaneStats, Priority, PriorityLock
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+    from bleak.backends.scanner import AdvertisementData
+    from bleak_retry_connector import BleakClient
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
-CONNECT_LOCK = asyncio.Lock()
+CONNECT_LOCK = PriorityLock()
 DEFAULT_TIMEOUT = 20
 DEFAULT_RETRY_COUNT = 5
 DEFAULT_SCAN_TIMEOUT = 30
+MAX_ADVERTISEMENTS = 256
 
 SVC1831 = '00001831-0000-1000-8000-00805f9b34fb'
 CHR2A89 = '00002a89-0000-1000-8000-00805f9b34fb'
+CHR2A26 = '00002a26-0000-1000-8000-00805f9b34fb'  # Firmware revision
+
+WRITE_MODE_RESPONSE = "response"
+WRITE_MODE_NO_RESPONSE = "no_response"
+ACK_TIMEOUT = 2
+ACK_MISS_THRESHOLD = 3
+# Pushes whose echo must advance the same bytes before presses are reported.
+PRESS_LEARN_PUSHES = 3
+# Seconds after a command, or after the link drops, in which a change is
+# still taken as the command's echo. Devices don't advertise while connected.
+PRESS_ECHO_TIMEOUT = 60
+
+# One lock per token file, as several clients can share a file.
+_CONFIG_LOCKS: dict[str, threading.Lock] = {}
+_CONFIG_LOCKS_LOCK = threading.Lock()
+
+def _config_lock(path: str) -> threading.Lock:
+    """Return the lock serializing access to a token file."""
+    with _CONFIG_LOCKS_LOCK:
+        return _CONFIG_LOCKS.setdefault(os.path.realpath(path), threading.Lock())
+
+def token_path(directory: str, bdaddr: str) -> str:
+    """Return the token file used for a device in `directory`."""
+    return os.path.join(
+        directory, "microbot-" + re.sub('[^a-f0-9]', '', bdaddr.lower()) + ".conf"
+    )
+
+class LinkLostError(Exception):
+    """Raised when the link to a device drops during a command."""
+
+class AckMissingError(Exception):
+    """Raised when an unacknowledged command gets no notification back."""
+
+class UnacknowledgedWriteError(Exception):
+    """Raised when the device refuses a write without response."""
+
+class NotCalibratedError(Exception):
+    """Raised for per-push overrides on a device that was never calibrated."""
 
 @dataclass
 class MicroBotAdvertisement:
@@ -54,13 +95,100 @@ def parse_advertisement_data(
             "address": device.address, # MacOS uses UUIDs
             "local_name": advertisement_data.local_name,
             "rssi": device.rssi,
-            "svc": advertisement_data.service_uuids[4],
+            "svc": services[4] if len(services) > 4 else None,
             "manufacturer_data_1280": advertisement_data.manufacturer_data.get(1280),
             "manufacturer_data_76": advertisement_data.manufacturer_data.get(76),
             }
 
     return MicroBotAdvertisement(device.address, data, device)
 
+def _changed_offsets(old: bytes | None, new: bytes | None) -> list[int] | None:
+    if old is None or new is None or old == new:
+        return None
+    changed = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+    changed.extend(range(min(len(old), len(new)), max(len(old), len(new))))
+    return changed
+
+class PressDetector:
+    """Tell presses made on the device from the echoes of our own commands.
+
+    The manufacturer data layout isn't documented, so the bytes carrying
+    the press counter are learned. The first change seen after a command
+    that changes the device's state is its echo and becomes the new
+    baseline, unless it comes more than PRESS_ECHO_TIMEOUT seconds after
+    the command or after the link went down. Bytes that went up by one in
+    the echo of every push are taken to count presses. Other changes, such
+    as battery level, are ignored.
+    """
+
+    def __init__(self) -> None:
+        """Press detector constructor."""
+        self._baseline: bytes | None = None
+        self._pending = False
+        self._pending_push = False
+        self._pending_since = 0.0
+        self._echoes = 0
+        self._candidates: set[int] | None = None
+
+    @property
+    def press_offsets(self) -> list[int]:
+        """Return the byte offsets known to count presses."""
+        if self._echoes < PRESS_LEARN_PUSHES or not self._candidates:
+            return []
+        return sorted(self._candidates)
+
+    def command_sent(self, push: bool = False, now: float | None = None) -> None:
+        """Expect the next change to be the echo of our own command."""
+        self._pending = True
+        self._pending_push = self._pending_push or push
+        self._pending_since = time.monotonic() if now is None else now
+
+    def link_down(self, now: float | None = None) -> None:
+        """Give a pending echo its time after the link went down."""
+        if self._pending:
+            self._pending_since = time.monotonic() if now is None else now
+
+    def update(self, data: bytes | None, now: float | None = None) -> int:
+        """Return the number of presses made on the device since the last update."""
+        if data is None:
+            return 0
+        if self._pending:
+            now = time.monotonic() if now is None else now
+            if now - self._pending_since > PRESS_ECHO_TIMEOUT:
+                _LOGGER.debug("No echo of the last command")
+                self._pending = self._pending_push = False
+        previous, self._baseline = self._baseline, bytes(data)
+        changed = _changed_offsets(previous, self._baseline)
+        if not changed:
+            return 0
+        if self._pending:
+            if self._pending_push:
+                self._learn(previous, self._baseline, changed)
+            self._pending = self._pending_push = False
+            return 0
+        offsets = self.press_offsets
+        if not offsets or not set(changed) & set(offsets):
+            _LOGGER.debug("Ignoring advertisement change at bytes %s", changed)
+            return 0
+        return max(_advance(previous, self._baseline, offset) for offset in offsets)
+
+    def _learn(self, previous: bytes, current: bytes, changed: list[int]) -> None:
+        counted = {
+            offset for offset in changed if _advance(previous, current, offset) == 1
+        }
+        self._echoes += 1
+        if self._candidates is None:
+            self._candidates = counted
+        else:
+            self._candidates &= counted
+        _LOGGER.debug("Press counter candidates: %s", sorted(self._candidates))
+
+def _advance(previous: bytes, current: bytes, offset: int) -> int:
+    """Return how far a wrapping byte counter moved."""
+    if offset >= min(len(previous), len(current)):
+        return 0
+    return (current[offset] - previous[offset]) % 256
+
 class GetMicroBotDevices:
     """Scan for all MicroBot devices and return"""
 
@@ -75,19 +203,25 @@ class GetMicroBotDevices:
     ) -> None:
         discovery = parse_advertisement_data(device, advertisement_data)
         if discovery:
+            # Keep the most recently seen devices, oldest are dropped first.
+            self._adv_data.pop(discovery.address, None)
             self._adv_data[discovery.address] = discovery
+            if len(self._adv_data) > MAX_ADVERTISEMENTS:
+                del self._adv_data[next(iter(self._adv_data))]
 
     async def discover(
         self, retry: int = DEFAULT_RETRY_COUNT, scan_timeout: int = DEFAULT_SCAN_TIMEOUT
     ) -> dict:
         """Find switchbot devices and their advertisement data."""
 
+        from bleak import BleakScanner
+
         _LOGGER.debug("Running discovery")
         devices = None
         devices = BleakScanner()
         devices.register_detection_callback(self.detection_callback)
 
-        async with CONNECT_LOCK:
+        async with CONNECT_LOCK.hold(Priority.MAINTENANCE):
             await devices.start()
             await asyncio.sleep(scan_timeout)
             await devices.stop()
@@ -158,18 +292,114 @@ class MicroBotApiClient:
         self._default_timeout = DEFAULT_TIMEOUT
 #        self._retry = 10
         self._retry: int = kwargs.pop("retry_count", DEFAULT_RETRY_COUNT)
+        self._auto_reconnect: bool = kwargs.pop("auto_reconnect", False)
         self._token = None
         self._config = expanduser(config)
-        self.__loadToken()
         self._depth = 50
         self._duration = 0
         self._mode = 0
+        self._calibrated = False
+        # Settings known to be on the device, None when unknown.
+        self._applied: dict[str, int | None] = {
+            "mode": None,
+            "depth": None,
+            "duration": None,
+        }
         self._is_on = None
+        self._presses = PressDetector()
+        self._frames = FrameRecorder()
+        self._lane = PriorityLock()
+        # Connection setup is serialized per adapter, shared by all clients
+        # unless the caller knows better.
+        self._connect_lock: PriorityLock = kwargs.pop("connect_lock", CONNECT_LOCK)
+        # Waits for the shared connect lock by this device alone.
+        self._connect_stats = {priority: LaneStats() for priority in Priority}
+        self._priority = Priority.INTERACTIVE
+        self._in_lane = False
+        self._connected = False
+        self._token_set = False
+        self._link_lost: asyncio.Future | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._write_mode: str | None = None
+        self._firmware: str | None = None
+        self._firmware_checked = False
+        self._ack: asyncio.Future | None = None
+        self._ack_id = b""
+        self._ack_pending = 0
+        self._ack_misses = 0
+        self._load: asyncio.Future | None = None
 
     @property
     def is_on(self):
         return self._is_on
 
+    @property
+    def advertisement(self) -> MicroBotAdvertisement | None:
+        """Return the last advertisement received from the device."""
+        return self._sb_adv_data
+
+    @property
+    def press_offsets(self) -> list[int]:
+        """Return the advertisement bytes learned to count presses."""
+        return self._presses.press_offsets
+
+    def toggle_state(self) -> None:
+        """Flip the assumed state after a press made on the device."""
+        if self._is_on is not None:
+            self._is_on = not self._is_on
+
+    @property
+    def lane_stats(self) -> dict[str, Any]:
+        """Return wait time metrics per priority lane.
+
+        `connect` covers this device's waits to set up a connection,
+        `connect_shared` those of every device sharing the connect lock.
+        """
+        return {
+            "device": self._lane.stats_as_dict(),
+            "connect": {
+                priority.name.lower(): stats.as_dict()
+                for priority, stats in self._connect_stats.items()
+            },
+            "connect_shared": self._connect_lock.stats_as_dict(),
+        }
+
+    @asynccontextmanager
+    async def lane(self, priority: Priority = Priority.INTERACTIVE):
+        """Run a sequence of commands in the given priority lane.
+
+        Commands on a device are serialized, and queued work is started in
+        priority order. Connections made inside the lane also queue at this
+        priority.
+        """
+        await self._lane.acquire(priority)
+        self._priority = priority
+        self._in_lane = True
+        try:
+            yield
+        finally:
+            self._in_lane = False
+            self._priority = Priority.INTERACTIVE
+            self._lane.release()
+
+    async def _checkpoint(self) -> None:
+        """Safe point between commands, more urgent queued work runs first."""
+        if self._in_lane:
+            priority = self._priority
+            if await self._lane.checkpoint(priority):
+                _LOGGER.debug("Yielded to more urgent commands")
+                # The commands that ran in between left the lane.
+                self._priority = priority
+                self._in_lane = True
+        if not self.is_connected():
+            _LOGGER.debug("Lost connection...reconnecting")
+            await self.connect(init=False)
+
+    @property
+    def frames(self) -> FrameRecorder:
+        """Return the recent GATT frames exchanged with the device."""
+        return self._frames
+
     @property
     def name(self) -> str:
         """Return device name."""
@@ -178,56 +408,290 @@ class MicroBotApiClient:
     async def notification_handler(self, handle: int, data: bytes) -> None:
         tmp = binascii.b2a_hex(data)[4:4+36]
         if b'0f0101' == tmp[:6] or b'0f0102' == tmp[:6]:
+            self._frames.record(RX, data)
             bdaddr = tmp[6:6+12]
             bdaddr_rcvd = bdaddr.decode()
             _LOGGER.debug("ack with bdaddr: %s", bdaddr_rcvd) 
             await self.getToken()
         elif b'1fff' == tmp[0:4] and b'0000000000000000000000' != tmp[6:6+22] and b'00000000' == tmp[28:36]:
+            self._frames.record(RX, data, secret=True)
             token = tmp[4:4+32]
             self._token = token.decode()
             _LOGGER.debug("ack with token")
             await self._client.stop_notify(CHR2A89)
-            self.__storeToken()
+            await self._config_io(self.__storeToken)
         else:
-            _LOGGER.debug(f'Received response at {handle=}: {hexlify(data, ":")!r}')
+            self._frames.record(RX, data)
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug("Received response at handle=%s: %s", handle, hexlify(data, ":"))
 
     async def notification_handler2(self, handle: int, data: bytes) -> None:
-        _LOGGER.debug(f'Received response at {handle=}: {hexlify(data).decode()}')
+        self._frames.record(RX, data)
+        # Notifications start with the id of the frames they answer, late
+        # ones for earlier commands are ignored.
+        if (
+            self._ack is not None
+            and not self._ack.done()
+            and bytes(data[:2]) == self._ack_id
+        ):
+            self._ack_pending -= 1
+            if self._ack_pending == 0:
+                self._ack.set_result(None)
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug("Received response at handle=%s: %s", handle, hexlify(data).decode())
 
-    async def is_connected(self, timeout=20):
-        if not self._client:
-            return False
+    @property
+    def write_mode(self) -> str | None:
+        """Return the write mode used for commands, None until probed."""
+        return self._write_mode
+
+    async def _write(
+        self, frame: bytearray, secret: bool = False, response: bool = True
+    ) -> None:
+        """Write a frame to the device and record it.
+
+        Fails as soon as the link drops instead of waiting for the write
+        to time out.
+        """
+        if not self.is_connected():
+            raise LinkLostError(f"Not connected to {self._bdaddr}")
+        self._frames.record(TX, frame, secret)
+        lost = self._link_lost
+        write = asyncio.ensure_future(
+            self._client.write_gatt_char(CHR2A89, frame, response=response)
+        )
         try:
-            return await asyncio.wait_for(
-                self._client.is_connected(),
-                self._default_timeout if timeout is None else timeout)
-        except asyncio.TimeoutError:
-            return False
+            await asyncio.wait((write, lost), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            write.cancel()
+            raise
+        if not write.done():
+            write.cancel()
+            raise LinkLostError(f"Link to {self._bdaddr} lost")
+        write.result()
+
+    async def _send(
+        self, header: bytearray, value: bytearray, secret: bool = False
+    ) -> None:
+        """Send a command frame pair using the device's write mode.
+
+        Unacknowledged writes are confirmed by the notifications the device
+        sends back, one per frame. After repeated missing notifications the
+        device falls back to acknowledged writes.
+        """
+        if self._write_mode != WRITE_MODE_NO_RESPONSE:
+            await self._write(header)
+            await self._write(value, secret)
+            return
+        try:
+            answered = await self._send_unacknowledged(header, value, secret)
+        except UnacknowledgedWriteError as e:
+            _LOGGER.warning(
+                "%s rejected an unacknowledged write, falling back to acknowledged writes: %s",
+                self._bdaddr,
+                e,
+            )
+            await self._use_write_mode(WRITE_MODE_RESPONSE)
+            await self._write(header)
+            await self._write(value, secret)
+            return
+        if answered:
+            self._ack_misses = 0
+            return
+        self._ack_misses += 1
+        if self._ack_misses >= ACK_MISS_THRESHOLD:
+            _LOGGER.warning(
+                "%s missed %d acks, falling back to acknowledged writes",
+                self._bdaddr,
+                self._ack_misses,
+            )
+            await self._use_write_mode(WRITE_MODE_RESPONSE)
+        raise AckMissingError(f"No ack from {self._bdaddr}")
+
+    async def _use_write_mode(self, mode: str) -> None:
+        """Switch to `mode` and remember it for the device."""
+        self._write_mode = mode
+        self._ack_misses = 0
+        _LOGGER.debug("Write mode: %s", mode)
+        await self._config_io(self.__storeCapabilities)
+
+    async def _send_unacknowledged(
+        self, header: bytearray, value: bytearray, secret: bool = False
+    ) -> bool:
+        """Send a frame pair without response, return true if both were answered.
+
+        The notifications are expected before the header goes out, so a
+        late one can't be mistaken for the answer to the value frame.
+        Raises UnacknowledgedWriteError if the write itself is refused, as
+        when the characteristic doesn't support writes without response.
+        """
+        ack = self._expect_ack(header[:2], frames=2)
+        try:
+            await self._write(header, response=False)
+            await self._write(value, secret, response=False)
+        except LinkLostError:
+            raise
         except Exception as e:
-            _LOGGER.error(e)
-            return False
+            if not self.is_connected():
+                raise LinkLostError(f"Link to {self._bdaddr} lost") from e
+            raise UnacknowledgedWriteError(str(e) or type(e).__name__) from e
+        else:
+            return await self._wait_ack(ack)
+        finally:
+            self._ack = None
+
+    def _expect_ack(self, frame_id: bytes, frames: int) -> asyncio.Future:
+        """Expect one notification per frame sent with `frame_id`."""
+        self._ack = asyncio.get_running_loop().create_future()
+        self._ack_id = bytes(frame_id)
+        self._ack_pending = frames
+        return self._ack
+
+    async def _wait_ack(self, ack: asyncio.Future) -> bool:
+        """Wait for the notifications, return false on timeout."""
+        await asyncio.wait(
+            (ack, self._link_lost),
+            timeout=ACK_TIMEOUT,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if not ack.done() and self._link_lost.done():
+            raise LinkLostError(f"Link to {self._bdaddr} lost")
+        return ack.done()
+
+    async def _read_firmware(self) -> None:
+        """Read the firmware revision once, a new firmware is probed again.
+
+        A failed read keeps the firmware and write mode already known, and
+        is tried again on the next connect.
+        """
+        try:
+            firmware = (await self._client.read_gatt_char(CHR2A26)).decode(
+                errors="replace"
+            ).strip("\x00 ")
+        except Exception as e:
+            _LOGGER.debug("Could not read firmware revision: %s", e)
+            return
+        self._firmware_checked = True
+        if firmware != self._firmware:
+            if self._firmware is not None:
+                _LOGGER.debug("Firmware changed to %s", firmware)
+            self._firmware = firmware
+            self._write_mode = None
+
+    async def _probe_write_mode(self, header: bytearray, value: bytearray) -> None:
+        """Find out whether the device handles unacknowledged writes.
+
+        The token frames are idempotent, so they are sent unacknowledged
+        and sent again acknowledged if no notification comes back.
+        """
+        _LOGGER.debug("Probing write mode")
+        try:
+            answered = await self._send_unacknowledged(header, value, secret=True)
+        except UnacknowledgedWriteError as e:
+            _LOGGER.debug("Unacknowledged write refused: %s", e)
+            answered = False
+        if answered:
+            await self._use_write_mode(WRITE_MODE_NO_RESPONSE)
+        else:
+            await self._write(header)
+            await self._write(value, secret=True)
+            await self._use_write_mode(WRITE_MODE_RESPONSE)
+
+    def _dump_frames(self, reason: str) -> None:
+        """Log the recent GATT frames after a failed command."""
+        _LOGGER.warning(
+            "%s on %s, recent GATT frames:\n%s", reason, self._bdaddr, self._frames
+        )
+
+    def is_connected(self) -> bool:
+        """Return true if the link is up, as last reported by bleak."""
+        return self._client is not None and self._connected
+
+    def is_ready(self) -> bool:
+        """Return true if the link is up and the token was accepted."""
+        return self.is_connected() and self._token_set
+
+    def setAutoReconnect(self, enabled: bool) -> None:
+        """Reconnect in the background when the link drops unexpectedly."""
+        self._auto_reconnect = enabled
+
+    def _on_disconnect(self, client: BleakClient) -> None:
+        """Handle the link dropping."""
+        if client is not self._client or not self._connected:
+            # Stale client, or a disconnect we asked for.
+            return
+        _LOGGER.debug("Link to %s lost", self._bdaddr)
+        self._connected = False
+        self._token_set = False
+        self._presses.link_down()
+        if self._link_lost is not None and not self._link_lost.done():
+            self._link_lost.set_result(None)
+        if self._auto_reconnect and (
+            self._reconnect_task is None or self._reconnect_task.done()
+        ):
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        async with self.lane(Priority.MAINTENANCE):
+            if not self.is_connected():
+                _LOGGER.debug("Reconnecting to %s", self._bdaddr)
+                await self.connect()
 
     async def _do_connect(self, timeout=20):
-        x = await self.is_connected()
-        if x == True:
+        if self.is_connected():
             _LOGGER.debug("Already connected")
         else:
-            async with CONNECT_LOCK:
+            from bleak_retry_connector import BleakClient, establish_connection
+
+            start = time.monotonic()
+            async with self._connect_lock.hold(self._priority):
+                self._connect_stats[self._priority].record(time.monotonic() - start)
+                await self._release_client()
                 try:
                     self._client = await establish_connection(
-                        BleakClient, self._device, self.name, max_attempts=self._retry
+                        BleakClient,
+                        self._device,
+                        self.name,
+                        disconnected_callback=self._on_disconnect,
+                        max_attempts=self._retry,
                     )
                     _LOGGER.debug("Connected!")
                     await self._client.start_notify(CHR2A89, self.notification_handler2)
                 except Exception as e:
                     _LOGGER.error(e)
+                    # Don't keep a half set up link around.
+                    await self._release_client()
+                    return
+                self._connected = True
+                self._token_set = False
+                self._link_lost = asyncio.get_running_loop().create_future()
+
+    async def _release_client(self):
+        """Disconnect and drop a client left over from an earlier link."""
+        client, self._client = self._client, None
+        if client is None:
+            return
+        try:
+            await client.disconnect()
+        except Exception as e:
+            _LOGGER.debug("Error releasing client: %s", e)
 
     async def _do_disconnect(self):
         if self.is_connected():
-            await self._client.stop_notify(CHR2A89)
-            await self._client.disconnect()
+            # Mark the link down first so the disconnect callback ignores it.
+            self._connected = False
+            self._token_set = False
+            try:
+                await self._client.stop_notify(CHR2A89)
+            finally:
+                await self._client.disconnect()
+                self._presses.link_down()
 
     async def connect(self, init=False, timeout=20):
+        await self.async_load()
+        if not init and self.is_ready():
+            _LOGGER.debug("Already connected to %s", self._bdaddr)
+            return
         retry = self._retry
         while True:
             _LOGGER.debug("Connecting to %s", self._bdaddr)
@@ -235,7 +699,8 @@ class MicroBotApiClient:
                 await asyncio.wait_for(
                     self._do_connect(),
                     self._default_timeout if timeout is None else timeout)
-                await self.__setToken(init) 
+                if self.is_connected():
+                    await self.__setToken(init)
                 break
             except Exception as e:
                 if retry == 0:
@@ -254,7 +719,33 @@ class MicroBotApiClient:
         except Exception as e:
             _LOGGER.error("error: %s", e)
 
+    async def async_load(self) -> None:
+        """Load the token and stored device settings, once.
+
+        Callers arriving while the file is being read wait for the same
+        read. A failed read is tried again by the next caller.
+        """
+        if self._load is None:
+            self._load = asyncio.ensure_future(self._config_io(self.__loadToken))
+        load = self._load
+        try:
+            await asyncio.shield(load)
+        except Exception:
+            if self._load is load:
+                self._load = None
+            raise
+
+    async def _config_io(self, func: Callable[[], None]) -> None:
+        """Run config file I/O in the executor, one access per file at a time."""
+        def _locked() -> None:
+            with _config_lock(self._config):
+                func()
+
+        await asyncio.get_running_loop().run_in_executor(None, _locked)
+
     def __loadToken(self):
+        import configparser
+
         _LOGGER.debug("Looking for token")
         config = configparser.ConfigParser()
         config.read(self._config)
@@ -262,19 +753,72 @@ class MicroBotApiClient:
         if config.has_option('tokens', bdaddr):
             self._token = config.get('tokens', bdaddr)
             _LOGGER.debug("Token found")
+        if config.has_option('capabilities', bdaddr+'_write_mode'):
+            self._write_mode = config.get('capabilities', bdaddr+'_write_mode')
+            self._firmware = config.get('capabilities', bdaddr+'_firmware', fallback=None)
+        # The file can be shared by several devices, only this device's
+        # settings count.
+        settings = [bdaddr+'_mode', bdaddr+'_depth', bdaddr+'_duration']
+        if all(config.has_option('settings', option) for option in settings):
+            self._mode, self._depth, self._duration = (
+                config.getint('settings', option) for option in settings
+            )
+            self._calibrated = True
 
     def __storeToken(self):
+        import configparser
+
         config = configparser.ConfigParser()
         config.read(self._config)
         if not config.has_section('tokens'):
             config.add_section('tokens')
         bdaddr = self._bdaddr.lower().replace(':', '')
         config.set('tokens', bdaddr, self._token)
-        os.umask(0)
-        with open(os.open(self._config, os.O_CREAT | os.O_WRONLY, 0o600), 'w') as file:
-            config.write(file)
+        self.__writeConfig(config)
         _LOGGER.debug("Token saved to file")
 
+    def __storeCapabilities(self):
+        import configparser
+
+        config = configparser.ConfigParser()
+        config.read(self._config)
+        if not config.has_section('capabilities'):
+            config.add_section('capabilities')
+        bdaddr = self._bdaddr.lower().replace(':', '')
+        config.set('capabilities', bdaddr+'_write_mode', self._write_mode)
+        config.set('capabilities', bdaddr+'_firmware', self._firmware or "unknown")
+        self.__writeConfig(config)
+        _LOGGER.debug("Capabilities saved to file")
+
+    def __storeSettings(self):
+        import configparser
+
+        config = configparser.ConfigParser()
+        config.read(self._config)
+        if not config.has_section('settings'):
+            config.add_section('settings')
+        bdaddr = self._bdaddr.lower().replace(':', '')
+        config.set('settings', bdaddr+'_mode', str(self._mode))
+        config.set('settings', bdaddr+'_depth', str(self._depth))
+        config.set('settings', bdaddr+'_duration', str(self._duration))
+        self.__writeConfig(config)
+        _LOGGER.debug("Settings saved to file")
+
+    def __writeConfig(self, config):
+        import tempfile
+
+        # Replace the file in one step, so a reader never sees it half
+        # written. mkstemp creates the file readable by the owner only.
+        path = os.path.realpath(self._config)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".microbot-")
+        try:
+            with open(fd, 'w') as file:
+                config.write(file)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
     def hasToken(self):
         if self._token == None:
             _LOGGER.debug("no token")
@@ -291,10 +835,11 @@ class MicroBotApiClient:
             bar2 = list(binascii.a2b_hex(id+"0fffffffffffffffffffffffffff"+self.__randomid(32)))
             _LOGGER.debug("Waiting for bdaddr notification")
             await self._client.start_notify(CHR2A89, self.notification_handler)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
+            await self._write(bytearray(bar1))
+            await self._write(bytearray(bar2))
         except Exception as e:
             _LOGGER.error("failed to init token: %s", e)
+            self._dump_frames("Token generation failed")
 
     async def __setToken(self, init):
         if init:
@@ -307,11 +852,17 @@ class MicroBotApiClient:
                     id = self.__randomid(16)
                     bar1 = list(binascii.a2b_hex(id+"00010000000000fa0000070000000000decd"))
                     bar2 = list(binascii.a2b_hex(id+"0fff"+self._token))
-                    await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-                    await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
+                    if not self._firmware_checked:
+                        await self._read_firmware()
+                    if self._write_mode is None:
+                        await self._probe_write_mode(bytearray(bar1), bytearray(bar2))
+                    else:
+                        await self._send(bytearray(bar1), bytearray(bar2), secret=True)
+                    self._token_set = True
                     _LOGGER.debug("Token set")
                 except Exception as e:
                     _LOGGER.error("Failed to set token: %s", e)
+                    self._dump_frames("Setting token failed")
 
     async def getToken(self):
         _LOGGER.debug("Getting token")
@@ -319,18 +870,35 @@ class MicroBotApiClient:
             id = self.__randomid(16)
             bar1 = list(binascii.a2b_hex(id+"00010040e20101fa01000000000000000000"))
             bar2 = list(binascii.a2b_hex(id+"0fffffffffffffffffff0000000000000000"))
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
+            await self._write(bytearray(bar1))
+            await self._write(bytearray(bar2))
             _LOGGER.warning('touch the button to get a token')
         except Exception as e:
             _LOGGER.error("failed to request token: %s", e)
+            self._dump_frames("Token request failed")
+
+    @property
+    def is_calibrated(self) -> bool:
+        """Return true if calibrated settings are known for the device."""
+        return self._calibrated
+
+    def check_overrides(self, depth=None, duration=None) -> None:
+        """Reject per-push overrides until the device is calibrated.
+
+        Without calibrated values to restore, an override would stay on
+        the device for every later press.
+        """
+        if (depth is not None or duration is not None) and not self._calibrated:
+            raise NotCalibratedError(
+                f"Calibrate {self._bdaddr} before overriding depth or duration"
+            )
 
     def setDepth(self, depth):
-        self._depth = depth
+        self._depth = int(depth)
         _LOGGER.debug("Depth: %s", depth)
 
     def setDuration(self, duration):
-        self._duration = duration
+        self._duration = int(duration)
         _LOGGER.debug("Duration: %s", duration)
 
     def setMode(self, mode):
@@ -342,75 +910,110 @@ class MicroBotApiClient:
             self._mode = 2
         _LOGGER.debug("Mode: %s", mode)
 
-    async def push_on(self):
+    async def push_on(self, depth=None, duration=None):
         _LOGGER.debug("Attempting to push")
-        x = await self.is_connected()
-        if x == False:
+        self.check_overrides(depth, duration)
+        if not self.is_connected():
             _LOGGER.debug("Lost connection...reconnecting")
             await self.connect(init=False)
         try:
+            await self._apply_settings(depth, duration)
             id = self.__randomid(16)
             bar1 = list(binascii.a2b_hex(id+"000100000008020000000a0000000000decd"))
             bar2 = list(binascii.a2b_hex(id+"0fffffffffff000000000000000000000000"))
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
+            self._presses.command_sent(push=True)
+            await self._send(bytearray(bar1), bytearray(bar2))
             _LOGGER.debug("Pushed")
             self._is_on = True
+            return True
         except Exception as e:
             _LOGGER.error("Failed to push: %s", e)
+            self._dump_frames("Push failed")
             self._is_on = False
+            return False
 
-    async def push_off(self):
+    async def push_off(self, depth=None, duration=None):
         _LOGGER.debug("Attempting to push")
-        x = await self.is_connected()
-        if x == False:
+        self.check_overrides(depth, duration)
+        if not self.is_connected():
             _LOGGER.debug("Lost connection...reconnecting")
             await self.connect(init=False)
         try:
+            await self._apply_settings(depth, duration)
             id = self.__randomid(16)
             bar1 = list(binascii.a2b_hex(id+"000100000008020000000a0000000000decd"))
             bar2 = list(binascii.a2b_hex(id+"0fffffffffff000000000000000000000000"))
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
+            self._presses.command_sent(push=True)
+            await self._send(bytearray(bar1), bytearray(bar2))
             _LOGGER.debug("Pushed")
             self._is_on = False
+            return True
         except Exception as e:
             _LOGGER.error("Failed to push: %s", e)
+            self._dump_frames("Push failed")
             self._is_on = True
+            return False
 
     async def calibrate(self):
         _LOGGER.debug("Setting calibration")
-        x = await self.is_connected()
-        if x == False:
-            _LOGGER.debug("Lost connection...reconnecting")
-            await self._connect(init=False)
         try:
-            id = self.__randomid(16) 
-            bar1 = list(binascii.a2b_hex(id+"000100000008030001000a0000000000decd"))
-            bar2 = list(binascii.a2b_hex(id+"0fff"+'{:02x}'.format(self._mode)+"000000"+"000000000000000000000000"))
-            bar3 = list(binascii.a2b_hex(id+"000100000008040001000a0000000000decd"))
-            bar4 = list(binascii.a2b_hex(id+"0fff"+'{:02x}'.format(self._depth)+"000000"+"000000000000000000000000"))
-            bar5 = list(binascii.a2b_hex(id+"000100000008050001000a0000000000decd"))
-            bar6 = list(binascii.a2b_hex(id+"0fff"+self._duration.to_bytes(4,"little").hex()+"000000000000000000000000"))
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar1), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar2), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar3), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar4), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar5), response=True)
-            await self._client.write_gatt_char(CHR2A89, bytearray(bar6), response=True)
+            for setting, value in (
+                ("mode", self._mode),
+                ("depth", self._depth),
+                ("duration", self._duration),
+            ):
+                await self._checkpoint()
+                self._presses.command_sent()
+                await self._send(*self.__settingFrames(setting, value))
+                self._applied[setting] = value
+            self._calibrated = True
+            await self._config_io(self.__storeSettings)
             _LOGGER.debug("Calibration set")
+            return True
         except Exception as e:
             _LOGGER.error("Failed to calibrate: %s", e)
+            self._dump_frames("Calibration failed")
+            return False
 
-    def update_from_advertisement(self, advertisement: MicroBotAdvertisement) -> None:
-        """Update device data from advertisement."""
+    async def _apply_settings(self, depth=None, duration=None):
+        """Send only the setting frames needed before a push.
+
+        Overrides apply to this push, and need the device to be calibrated.
+        Without an override the calibrated value is restored.
+        """
+        if not self._calibrated:
+            return
+        for setting, override, calibrated in (
+            ("depth", depth, self._depth),
+            ("duration", duration, self._duration),
+        ):
+            value = calibrated if override is None else int(override)
+            if self._applied[setting] != value:
+                _LOGGER.debug("Applying %s: %s", setting, value)
+                self._presses.command_sent()
+                await self._send(*self.__settingFrames(setting, value))
+                self._applied[setting] = value
+
+    def __settingFrames(self, setting, value):
+        code = {"mode": "03", "depth": "04", "duration": "05"}[setting]
+        if setting == "duration":
+            encoded = value.to_bytes(4,"little").hex()
+        else:
+            encoded = '{:02x}'.format(value)+"000000"
+        id = self.__randomid(16)
+        bar1 = list(binascii.a2b_hex(id+"000100000008"+code+"0001000a0000000000decd"))
+        bar2 = list(binascii.a2b_hex(id+"0fff"+encoded+"000000000000000000000000"))
+        return bytearray(bar1), bytearray(bar2)
+
+    def update_from_advertisement(self, advertisement: MicroBotAdvertisement) -> int:
+        """Update device data from advertisement.
+
+        Returns the number of presses made on the device itself since the
+        last advertisement, 0 when there were none or they can't be told.
+        """
         self._sb_adv_data = advertisement
         self._device = advertisement.device
-
-    def __randomstr(self, n):
-       randstr = [random.choice(string.printable) for i in range(n)]
-       return ''.join(randstr)
+        return self._presses.update(advertisement.data.get("manufacturer_data_1280"))
 
     def __randomid(self, bits):
-       fmtstr = '{:'+'{:02d}'.format(int(bits/4))+'x}'
-       return fmtstr.format(random.randrange(2**bits))
+       return os.urandom(bits // 8).hex()
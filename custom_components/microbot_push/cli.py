@@ -0,0 +1,137 @@
+"""Command line interface for driving MicroBots without Home Assistant.
+
+Usage:
+    microbot-push discover
+    python -m custom_components.microbot_push discover
+    python -m custom_components.microbot_push run script.txt
+    echo "* push" | python -m custom_components.microbot_push run -
+
+Results are written to stdout as JSON lines.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import TextIO
+
+from .fleet import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_CONNECT_CONCURRENCY,
+    MicroBotFleet,
+    ScriptError,
+    parse_script,
+)
+from .api import DEFAULT_RETRY_COUNT
+
+DEFAULT_TOKEN_DIR = "~/.config/microbot_push"
+DEFAULT_SCAN_TIMEOUT = 10
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="microbot_push", description="Drive MicroBot Push devices."
+    )
+    tokens = parser.add_mutually_exclusive_group()
+    tokens.add_argument(
+        "--token-dir",
+        default=DEFAULT_TOKEN_DIR,
+        help="directory of per-device token files (default: %(default)s)",
+    )
+    tokens.add_argument(
+        "--config", help="single token file, e.g. ~/.microbot.conf"
+    )
+    parser.add_argument(
+        "--scan-timeout",
+        type=int,
+        default=DEFAULT_SCAN_TIMEOUT,
+        help="seconds to scan for devices (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="devices driven at the same time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--connect-concurrency",
+        type=int,
+        default=DEFAULT_CONNECT_CONCURRENCY,
+        help="connections set up at the same time, most adapters manage "
+        "one (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retry-count",
+        type=int,
+        default=DEFAULT_RETRY_COUNT,
+        help="connection retries per command (default: %(default)s)",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("discover", help="list MicroBots in range")
+    run = commands.add_parser("run", help="run a command script")
+    run.add_argument(
+        "script",
+        nargs="?",
+        default="-",
+        type=argparse.FileType("r"),
+        help="script file, or - for stdin (default)",
+    )
+    return parser
+
+
+def _emit(out: TextIO, data: dict) -> None:
+    out.write(json.dumps(data) + "\n")
+    out.flush()
+
+
+async def _discover(fleet: MicroBotFleet, args: argparse.Namespace, out: TextIO) -> int:
+    for address, adv in (await fleet.discover(args.scan_timeout)).items():
+        _emit(
+            out,
+            {
+                "address": address,
+                "name": adv.data["local_name"],
+                "rssi": adv.data["rssi"],
+                "token": fleet.client(address).hasToken(),
+            },
+        )
+    return 0
+
+
+async def _run(fleet: MicroBotFleet, args: argparse.Namespace, out: TextIO) -> int:
+    try:
+        commands = parse_script(args.script)
+    except ScriptError as e:
+        print(f"microbot_push: {e}", file=sys.stderr)
+        return 2
+    await fleet.discover(args.scan_timeout)
+    failed = 0
+    async for result in fleet.run(commands):
+        failed += not result.ok
+        _emit(out, result.as_dict())
+    return 1 if failed else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Run the command line interface."""
+    args = _parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    return asyncio.run(_main(args))
+
+
+async def _main(args: argparse.Namespace) -> int:
+    fleet = MicroBotFleet(
+        token_dir=None if args.config else os.path.expanduser(args.token_dir),
+        config=args.config and os.path.expanduser(args.config),
+        concurrency=args.concurrency,
+        retry_count=args.retry_count,
+        connect_concurrency=args.connect_concurrency,
+    )
+    handler = _discover if args.command == "discover" else _run
+    return await handler(fleet, args, sys.stdout)
@@ -1,33 +1,29 @@
 """Adds config flow for MicroBot."""
 from __future__ import annotations
 import logging
-import re
 from typing import Any
-from .api import MicroBotAdvertisement, parse_advertisement_data, MicroBotApiClient
+from .api import MicroBotAdvertisement, parse_advertisement_data, MicroBotApiClient, token_path
 from homeassistant.config_entries import ConfigEntry, ConfigFlow, OptionsFlow
-from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 import voluptuous as vol
 from homeassistant.components import bluetooth
-from homeassistant.components.bluetooth import (
-    BluetoothServiceInfoBleak,
-    async_discovered_service_info,
-)
+from homeassistant.components.bluetooth import BluetoothServiceInfoBleak
+from .discovery import async_get_discovery_index, format_unique_id
 from .const import (
     CONF_NAME,
     CONF_BDADDR,
     DOMAIN,
     CONF_RETRY_COUNT, 
     DEFAULT_RETRY_COUNT, 
+    CONF_PRECONNECT,
+    DEFAULT_PRECONNECT,
+    CONF_TRACE,
+    DEFAULT_TRACE,
 )
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
-def format_unique_id(address: str) -> str:
-    """Format the unique ID for a switchbot."""
-    return address.replace(":", "").lower()
-
 class MicroBotConfigFlow(ConfigFlow, domain=DOMAIN):
     """Config flow for MicroBot."""
 
@@ -61,6 +57,8 @@ class MicroBotConfigFlow(ConfigFlow, domain=DOMAIN):
         parsed = parse_advertisement_data(
             discovery_info.device, discovery_info.advertisement
         )
+        if not parsed:
+            return self.async_abort(reason="microbot_unsupported_type")
         self._discovered_adv = parsed
         data = parsed.data
         self.context["title_placeholders"] = {
@@ -85,19 +83,9 @@ class MicroBotConfigFlow(ConfigFlow, domain=DOMAIN):
         if discovery := self._discovered_adv:
             self._discovered_advs[discovery.address] = discovery
         else:
-            current_addresses = self._async_current_ids()
-            for discovery_info in async_discovered_service_info(self.hass):
-                address = discovery_info.address
-                if (
-                    format_unique_id(address) in current_addresses
-                    or address in self._discovered_advs
-                ):
-                    continue
-                parsed = parse_advertisement_data(
-                    discovery_info.device, discovery_info.advertisement
-                )
-                if parsed:
-                    self._discovered_advs[address] = parsed
+            self._discovered_advs.update(
+                async_get_discovery_index(self.hass).async_unconfigured()
+            )
 
         if not self._discovered_advs:
             return self.async_abort(reason="no_unconfigured_devices")
@@ -123,15 +111,14 @@ class MicroBotConfigFlow(ConfigFlow, domain=DOMAIN):
             self._abort_if_unique_id_configured()
             self._ble_device = bluetooth.async_ble_device_from_address(self.hass, self._bdaddr.upper())
             if not self._ble_device:
-                raise ConfigEntryNotReady(
-                    f"Could not find MicroBot with address {self._bdaddr}"
-            )
-            conf = self.hass.config.path()+"/.storage/microbot-"+re.sub('[^a-f0-9]', '', self._bdaddr.lower())+".conf"
+                # The device went out of range after the list was shown.
+                return self.async_abort(reason="device_not_found")
             self._client = MicroBotApiClient(
                 device=self._ble_device,
-                config=conf,
+                config=token_path(self.hass.config.path(".storage"), self._bdaddr),
                 retry_count=DEFAULT_RETRY_COUNT,
             )
+            await self._client.async_load()
             token = self._client.hasToken()
             if not token:
                 return await self.async_step_link()       
@@ -189,7 +176,17 @@ class MicroBotOptionsFlowHandler(OptionsFlow):
                 default=self.config_entry.options.get(
                     CONF_RETRY_COUNT, DEFAULT_RETRY_COUNT
                 ),
-            ): int
+            ): int,
+            vol.Optional(
+                CONF_PRECONNECT,
+                default=self.config_entry.options.get(
+                    CONF_PRECONNECT, DEFAULT_PRECONNECT
+                ),
+            ): bool,
+            vol.Optional(
+                CONF_TRACE,
+                default=self.config_entry.options.get(CONF_TRACE, DEFAULT_TRACE),
+            ): bool,
         }
 
         return self.async_show_form(step_id="init", data_schema=vol.Schema(options))
@@ -7,6 +7,14 @@ VERSION = "2022.08.0"
 MANUFACTURER = "Naran/Keymitt"
 ISSUE_URL = "https://github.com/spycle/microbot_push/issues"
 
+# Trace
+DATA_TRACE = f"{DOMAIN}_trace"
+DATA_USAGE = f"{DOMAIN}_usage"
+TRACE_FILE = f"{DOMAIN}.trace.csv"
+
+# Events
+EVENT_MICROBOT = f"{DOMAIN}_event"
+
 # Icons
 ICON = "mdi:toggle-switch-variant"
 
@@ -27,6 +35,10 @@ CONF_PASSWORD = "password"
 CONF_BDADDR = "bdaddr"
 CONF_RETRY_COUNT = "retry_count"
 DEFAULT_RETRY_COUNT = 5
+CONF_PRECONNECT = "preconnect"
+DEFAULT_PRECONNECT = False
+CONF_TRACE = "trace"
+DEFAULT_TRACE = False
 
 # Defaults
 DEFAULT_NAME = "Microbot"
@@ -0,0 +1,231 @@
+"""Coordinator for MicroBot."""
+from __future__ import annotations
+import asyncio
+from datetime import datetime, timedelta
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+
+from homeassistant.components import bluetooth
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.components.bluetooth.passive_update_coordinator import (
+    PassiveBluetoothDataUpdateCoordinator,
+)
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from .api import MicroBotApiClient, parse_advertisement_data
+from .const import EVENT_MICROBOT
+from .scheduler import Priority
+from .trace import TraceRecorder
+from .usage import UsageHistogram
+
+if TYPE_CHECKING:
+    from bleak.backends.device import BLEDevice
+
+PRECONNECT_LEAD = timedelta(minutes=2)
+PRECONNECT_INTERVAL = timedelta(minutes=1)
+USAGE_SAVE_DELAY = 60
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+class MicroBotDataUpdateCoordinator(PassiveBluetoothDataUpdateCoordinator):
+    """Class to manage fetching data from the MicroBot."""
+
+    def __init__(
+        self, hass: HomeAssistant, client: MicroBotApiClient, ble_device: BLEDevice,
+    ) -> None:
+        """Initialize."""
+        self.api = client
+        self.platforms = []
+        self._ready_event = asyncio.Event()
+        self.data: dict[str, Any] = {}
+        self.ble_device = ble_device
+        self.trace: TraceRecorder | None = None
+        self._usage: UsageHistogram | None = None
+        self._usage_store: Store | None = None
+        self._window_end: datetime | None = None
+        self._window_used = False
+        self._preconnect_stats = {
+            "presses": 0,
+            "warm_presses": 0,
+            "windows": 0,
+            "windows_used": 0,
+        }
+
+        super().__init__(
+            hass, _LOGGER, ble_device.address, bluetooth.BluetoothScanningMode.ACTIVE
+        )
+
+    @callback
+    def _async_handle_bluetooth_event(
+        self,
+        service_info: bluetooth.BluetoothServiceInfoBleak,
+        change: bluetooth.BluetoothChange,
+    ) -> None:
+        """Handle a Bluetooth event."""
+        super()._async_handle_bluetooth_event(service_info, change)
+        if adv := parse_advertisement_data(
+            service_info.device, service_info.advertisement
+        ):
+            self.data = adv.data
+            if self.data:
+                self._ready_event.set()
+            _LOGGER.debug("%s: MicroBot data: %s", self.ble_device.address, self.data)
+            if presses := self.api.update_from_advertisement(adv):
+                self._async_device_pressed(presses)
+        self.async_update_listeners()
+
+    @callback
+    def _async_device_pressed(self, presses: int) -> None:
+        """Handle presses made on the device itself, e.g. its button."""
+        _LOGGER.debug("%s: pressed %d time(s) on the device", self.ble_device.address, presses)
+        if presses % 2:
+            self.api.toggle_state()
+        self.hass.bus.async_fire(
+            EVENT_MICROBOT,
+            {
+                "address": self.ble_device.address,
+                "type": "device_press",
+                "presses": presses,
+                "is_on": self.api.is_on,
+            },
+        )
+
+    async def async_push(
+        self,
+        on: bool,
+        priority: Priority,
+        depth: int | None = None,
+        duration: int | None = None,
+    ) -> bool:
+        """Push the button, reusing a pre-connected link if there is one.
+
+        Depth and duration override the calibrated settings for this push,
+        NotCalibratedError is raised if the device was never calibrated.
+        """
+        await self.api.async_load()
+        self.api.check_overrides(depth, duration)
+
+        async def _push() -> bool:
+            if self._usage is not None:
+                self._record_usage(self.api.is_ready())
+            # Returns at once when the link is ready, and sets the token
+            # again if that failed when the link was opened.
+            await self.api.connect()
+            if on:
+                ok = await self.api.push_on(depth, duration)
+            else:
+                ok = await self.api.push_off(depth, duration)
+            if self._window_end is None:
+                await self.api.disconnect()
+            return ok
+
+        return await self.async_run("push_on" if on else "push_off", priority, _push)
+
+    async def async_run(
+        self, command: str, priority: Priority, job: Callable[[], Awaitable[bool]]
+    ) -> bool:
+        """Run a command in its lane, adding it to the trace if enabled."""
+        started = time.monotonic()
+        async with self.api.lane(priority):
+            acquired = time.monotonic()
+            ok = False
+            try:
+                ok = await job()
+            finally:
+                if self.trace is not None:
+                    self.trace.record(
+                        self.ble_device.address,
+                        command,
+                        priority.name.lower(),
+                        started,
+                        acquired,
+                        time.monotonic(),
+                        ok,
+                    )
+        return ok
+
+    @property
+    def preconnect_stats(self) -> dict[str, Any] | None:
+        """Return how often presses found a warm connection."""
+        if self._usage is None:
+            return None
+        stats = self._preconnect_stats
+        return {
+            **stats,
+            "hit_rate": stats["warm_presses"] / stats["presses"] if stats["presses"] else None,
+        }
+
+    @callback
+    def _record_usage(self, warm: bool) -> None:
+        self._usage.record(dt_util.now())
+        self._usage_store.async_delay_save(self._usage.as_dict, USAGE_SAVE_DELAY)
+        self._preconnect_stats["presses"] += 1
+        if warm:
+            self._preconnect_stats["warm_presses"] += 1
+        if self._window_end is not None:
+            self._window_used = True
+
+    @callback
+    def async_start_preconnect(self, store: Store) -> Callable[[], None]:
+        """Learn usage patterns and connect ahead of likely presses.
+
+        The saved histogram is loaded in the background so setup doesn't
+        wait for storage.
+        """
+        self._usage = UsageHistogram()
+        self._usage_store = store
+        self.hass.async_create_task(self._async_load_usage())
+        cancel = async_track_time_interval(
+            self.hass, self._async_check_preconnect, PRECONNECT_INTERVAL
+        )
+
+        @callback
+        def _stop() -> None:
+            cancel()
+            if self._window_end is not None:
+                self.hass.async_create_task(self._async_close_window())
+
+        return _stop
+
+    async def _async_load_usage(self) -> None:
+        if data := await self._usage_store.async_load():
+            self._usage.load(data)
+
+    async def _async_check_preconnect(self, now: datetime) -> None:
+        """Open or close the pre-connect window."""
+        now = dt_util.as_local(now)
+        if self._window_end is not None:
+            if now >= self._window_end:
+                await self._async_close_window()
+            return
+        upcoming = now + PRECONNECT_LEAD
+        if not self._usage.likely(upcoming):
+            return
+        self._window_end = self._usage.slot_end(upcoming)
+        self._window_used = False
+        self._preconnect_stats["windows"] += 1
+        _LOGGER.debug(
+            "%s: pre-connecting until %s", self.ble_device.address, self._window_end
+        )
+        self.api.setAutoReconnect(True)
+        async with self.api.lane(Priority.MAINTENANCE):
+            await self.api.connect()
+
+    async def _async_close_window(self) -> None:
+        self._window_end = None
+        if self._window_used:
+            self._preconnect_stats["windows_used"] += 1
+        _LOGGER.debug("%s: closing pre-connect window", self.ble_device.address)
+        self.api.setAutoReconnect(False)
+        async with self.api.lane(Priority.MAINTENANCE):
+            await self.api.disconnect()
+
+    async def async_wait_ready(self) -> bool:
+        """Wait for the device to be ready."""
+        try:
+            await asyncio.wait_for(self._ready_event.wait(), timeout=55)
+        except asyncio.TimeoutError:
+            return False
+        return True
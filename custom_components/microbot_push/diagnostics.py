@@ -0,0 +1,27 @@
+"""Diagnostics support for MicroBot."""
+from __future__ import annotations
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import CONF_BDADDR, DOMAIN
+
+TO_REDACT = {CONF_BDADDR, "address"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "advertisement": async_redact_data(coordinator.data, TO_REDACT),
+        "frames": coordinator.api.frames.as_dicts(),
+        "write_mode": coordinator.api.write_mode,
+        "press_offsets": coordinator.api.press_offsets,
+        "lanes": coordinator.api.lane_stats,
+        "preconnect": coordinator.preconnect_stats,
+    }
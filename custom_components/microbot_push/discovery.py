@@ -0,0 +1,130 @@
+"""Discovery index for MicroBot."""
+from __future__ import annotations
+import logging
+
+from homeassistant.components import bluetooth
+from homeassistant.components.bluetooth import (
+    BluetoothCallbackMatcher,
+    BluetoothServiceInfoBleak,
+    async_discovered_service_info,
+)
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import Event, HomeAssistant, callback
+
+from .api import SVC1831, MicroBotAdvertisement, parse_advertisement_data
+from .const import DOMAIN
+
+DATA_DISCOVERY = f"{DOMAIN}_discovery"
+LOCAL_NAME_PREFIX = "mib"
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+
+def format_unique_id(address: str) -> str:
+    """Format the unique ID for a switchbot."""
+    return address.replace(":", "").lower()
+
+
+def _is_microbot(service_info: BluetoothServiceInfoBleak) -> bool:
+    """Cheap check done before parsing an advertisement."""
+    return SVC1831 in service_info.service_uuids or (
+        service_info.name or ""
+    ).startswith(LOCAL_NAME_PREFIX)
+
+
+class MicroBotDiscoveryIndex:
+    """Unconfigured MicroBots seen by the bluetooth integration.
+
+    The index is seeded once from the bluetooth integration's discovered
+    devices and then kept up to date from bluetooth callbacks, so config
+    flows don't have to walk and parse every advertisement in range.
+    Devices that have gone out of range are dropped when the index is read.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize."""
+        self._hass = hass
+        self._unconfigured: dict[str, MicroBotAdvertisement] = {}
+        self._configured: set[str] = {
+            entry.unique_id
+            for entry in hass.config_entries.async_entries(DOMAIN)
+            if entry.unique_id
+        }
+        self._unsubs: list = []
+
+    @callback
+    def async_start(self) -> None:
+        """Seed the index and listen for new advertisements."""
+        for service_info in async_discovered_service_info(self._hass):
+            self._async_update(service_info)
+        for matcher in (
+            BluetoothCallbackMatcher(service_uuid=SVC1831),
+            BluetoothCallbackMatcher(local_name=f"{LOCAL_NAME_PREFIX}*"),
+        ):
+            self._unsubs.append(
+                bluetooth.async_register_callback(
+                    self._hass,
+                    self._async_handle_bluetooth_event,
+                    matcher,
+                    bluetooth.BluetoothScanningMode.ACTIVE,
+                )
+            )
+        self._hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_stop)
+
+    @callback
+    def _async_stop(self, event: Event) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+
+    @callback
+    def _async_handle_bluetooth_event(
+        self,
+        service_info: BluetoothServiceInfoBleak,
+        change: bluetooth.BluetoothChange,
+    ) -> None:
+        self._async_update(service_info)
+
+    @callback
+    def _async_update(self, service_info: BluetoothServiceInfoBleak) -> None:
+        if not _is_microbot(service_info):
+            return
+        if format_unique_id(service_info.address) in self._configured:
+            return
+        if parsed := parse_advertisement_data(
+            service_info.device, service_info.advertisement
+        ):
+            self._unconfigured[service_info.address] = parsed
+
+    @callback
+    def async_mark_configured(self, unique_id: str) -> None:
+        """Stop offering a device once it has a config entry."""
+        self._configured.add(unique_id)
+        for address in list(self._unconfigured):
+            if format_unique_id(address) == unique_id:
+                del self._unconfigured[address]
+
+    @callback
+    def async_mark_unconfigured(self, unique_id: str) -> None:
+        """Offer a device again after its config entry is removed."""
+        self._configured.discard(unique_id)
+
+    @callback
+    def async_unconfigured(self) -> dict[str, MicroBotAdvertisement]:
+        """Return the unconfigured MicroBots in range by address."""
+        for address in [
+            address
+            for address in self._unconfigured
+            if not bluetooth.async_address_present(self._hass, address)
+        ]:
+            del self._unconfigured[address]
+        return dict(self._unconfigured)
+
+
+@callback
+def async_get_discovery_index(hass: HomeAssistant) -> MicroBotDiscoveryIndex:
+    """Return the discovery index, starting it on first use."""
+    if (index := hass.data.get(DATA_DISCOVERY)) is None:
+        index = hass.data[DATA_DISCOVERY] = MicroBotDiscoveryIndex(hass)
+        index.async_start()
+    return index
@@ -0,0 +1,263 @@
+"""Drive several MicroBots concurrently without Home Assistant."""
+from __future__ import annotations
+import asyncio
+from dataclasses import asdict, dataclass, field
+import logging
+import shlex
+import time
+from typing import Any, AsyncIterator, Iterable
+
+from .api import GetMicroBotDevices, MicroBotAdvertisement, MicroBotApiClient, token_path
+from .api import DEFAULT_RETRY_COUNT
+from .scheduler import PriorityLock
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+DEFAULT_CONCURRENCY = 4
+# Most adapters set up one connection at a time.
+DEFAULT_CONNECT_CONCURRENCY = 1
+ALL_DEVICES = "*"
+COMMANDS = ("push_on", "push_off", "calibrate", "sequence")
+ALIASES = {"push": "push_on", "on": "push_on", "off": "push_off"}
+MODES = ("normal", "invert", "toggle")
+# Limits of the calibrate service.
+MAX_DEPTH = 100
+MAX_DURATION = 999999
+
+
+class ScriptError(ValueError):
+    """Raised for a malformed command script."""
+
+
+@dataclass
+class Command:
+    """A command for one device, or every device when address is `*`."""
+
+    address: str
+    name: str
+    args: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CommandResult:
+    """Outcome of one command on one device."""
+
+    address: str
+    command: str
+    ok: bool
+    queued: float
+    latency: float
+    error: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def parse_script(lines: Iterable[str]) -> list[Command]:
+    """Parse a command script.
+
+    Each line is `<address|*> <command> [args...]`, blank lines and lines
+    starting with `#` are ignored. Commands are:
+
+        push_on (push, on)
+        push_off (off)
+        calibrate <depth> <duration> <normal|invert|toggle>
+        sequence <step> [<step>...]
+
+    Depth is 0 to 100 and duration 0 to 999999 seconds. Sequence
+    steps are `push_on`, `push_off` or `wait:<seconds>` and run in a single
+    connection.
+    """
+    commands = []
+    for number, line in enumerate(lines, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+        if len(words) < 2:
+            raise ScriptError(f"line {number}: expected '<address> <command>'")
+        address, name, *args = words
+        name = ALIASES.get(name, name)
+        if name not in COMMANDS:
+            raise ScriptError(f"line {number}: unknown command {name!r}")
+        if name == "calibrate":
+            if len(args) != 3 or not args[0].isdigit() or not args[1].isdigit():
+                raise ScriptError(
+                    f"line {number}: expected 'calibrate <depth> <duration> <mode>'"
+                )
+            if int(args[0]) > MAX_DEPTH:
+                raise ScriptError(f"line {number}: depth must be 0 to {MAX_DEPTH}")
+            if int(args[1]) > MAX_DURATION:
+                raise ScriptError(
+                    f"line {number}: duration must be 0 to {MAX_DURATION}"
+                )
+            if args[2] not in MODES:
+                raise ScriptError(
+                    f"line {number}: mode must be one of {', '.join(MODES)}"
+                )
+        elif name == "sequence":
+            if not args:
+                raise ScriptError(f"line {number}: empty sequence")
+            args = [ALIASES.get(step, step) for step in args]
+            for step in args:
+                if step.startswith("wait:"):
+                    if _wait_seconds(step) is None:
+                        raise ScriptError(f"line {number}: bad wait {step!r}")
+                elif step not in ("push_on", "push_off"):
+                    raise ScriptError(f"line {number}: unknown step {step!r}")
+        elif args:
+            raise ScriptError(f"line {number}: {name} takes no arguments")
+        commands.append(Command(address, name, args))
+    return commands
+
+
+def _wait_seconds(step: str) -> float | None:
+    """Return the seconds of a `wait:<seconds>` step, None if malformed."""
+    try:
+        seconds = float(step[5:])
+    except ValueError:
+        return None
+    if not 0 <= seconds < float("inf"):
+        return None
+    return seconds
+
+
+class MicroBotFleet:
+    """Discover MicroBots and run commands against many of them at once.
+
+    Tokens are read from `config` when given, the single file format used by
+    the original microbot tool, otherwise from the per-device files that the
+    integration keeps in `token_dir`. Commands for the same device run in
+    order; at most `concurrency` devices are driven at the same time.
+
+    Connection setup, the slowest step, is limited separately by
+    `connect_concurrency`, as most adapters connect to one device at a
+    time. With the default of one, only the work after connecting runs
+    concurrently. Raise it for adapters that can connect to several
+    devices at once.
+    """
+
+    def __init__(
+        self,
+        token_dir: str | None = None,
+        config: str | None = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        retry_count: int = DEFAULT_RETRY_COUNT,
+        connect_concurrency: int = DEFAULT_CONNECT_CONCURRENCY,
+    ) -> None:
+        """MicroBot fleet constructor."""
+        if token_dir is None and config is None:
+            raise ValueError("token_dir or config is required")
+        self._token_dir = token_dir
+        self._config = config
+        self._retry = retry_count
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._connect_lock = PriorityLock(connect_concurrency)
+        self._bots: dict[str, MicroBotAdvertisement] = {}
+        self._clients: dict[str, MicroBotApiClient] = {}
+
+    @property
+    def bots(self) -> dict[str, MicroBotAdvertisement]:
+        return self._bots
+
+    async def discover(self, scan_timeout: int) -> dict[str, MicroBotAdvertisement]:
+        """Scan for MicroBots in range."""
+        self._bots = await GetMicroBotDevices().discover(scan_timeout=scan_timeout)
+        await asyncio.gather(*(self.client(address).async_load() for address in self._bots))
+        return self._bots
+
+    def client(self, address: str) -> MicroBotApiClient:
+        """Return the client for a discovered device."""
+        address = address.upper()
+        if address not in self._clients:
+            if address not in self._bots:
+                raise KeyError(address)
+            self._clients[address] = MicroBotApiClient(
+                device=self._bots[address].device,
+                config=self._config or token_path(self._token_dir, address),
+                retry_count=self._retry,
+                connect_lock=self._connect_lock,
+            )
+        return self._clients[address]
+
+    def _expand(self, commands: Iterable[Command]) -> dict[str, list[Command]]:
+        """Group commands per device, in script order."""
+        per_device: dict[str, list[Command]] = {}
+        for command in commands:
+            if command.address == ALL_DEVICES:
+                addresses = [
+                    address for address in self._bots if self.client(address).hasToken()
+                ]
+            else:
+                addresses = [command.address.upper()]
+            for address in addresses:
+                per_device.setdefault(address, []).append(
+                    Command(address, command.name, command.args)
+                )
+        return per_device
+
+    async def run(self, commands: Iterable[Command]) -> AsyncIterator[CommandResult]:
+        """Run commands, yielding results as they complete."""
+        results: asyncio.Queue[CommandResult | None] = asyncio.Queue()
+        per_device = self._expand(commands)
+
+        async def _device(address: str, queue: list[Command]) -> None:
+            for command in queue:
+                await results.put(await self._run_one(command, time.monotonic()))
+
+        tasks = [
+            asyncio.create_task(_device(address, queue))
+            for address, queue in per_device.items()
+        ]
+        done = asyncio.gather(*tasks)
+        done.add_done_callback(lambda _: results.put_nowait(None))
+        while (result := await results.get()) is not None:
+            yield result
+        await done
+
+    async def _run_one(self, command: Command, queued_at: float) -> CommandResult:
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                ok, error = await self._execute(command)
+            except Exception as e:  # pylint: disable=broad-except
+                ok, error = False, str(e) or type(e).__name__
+            return CommandResult(
+                address=command.address,
+                command=" ".join([command.name, *command.args]),
+                ok=ok,
+                queued=started - queued_at,
+                latency=time.monotonic() - started,
+                error=error,
+            )
+
+    async def _execute(self, command: Command) -> tuple[bool, str | None]:
+        try:
+            client = self.client(command.address)
+        except KeyError:
+            return False, "device not found"
+        if not client.hasToken():
+            return False, "no token"
+        async with client.lane():
+            await client.connect()
+            if not client.is_ready():
+                return False, "connect failed"
+            try:
+                if command.name == "calibrate":
+                    depth, duration, mode = command.args
+                    client.setDepth(int(depth))
+                    client.setDuration(int(duration))
+                    client.setMode(mode)
+                    ok = await client.calibrate()
+                elif command.name == "sequence":
+                    ok = True
+                    for step in command.args:
+                        if step.startswith("wait:"):
+                            await asyncio.sleep(_wait_seconds(step))
+                        elif not await getattr(client, step)():
+                            ok = False
+                            break
+                else:
+                    ok = await getattr(client, command.name)()
+            finally:
+                await client.disconnect()
+        return ok, None if ok else "command failed"
@@ -0,0 +1,59 @@
+"""GATT frame flight recorder for MicroBot."""
+from __future__ import annotations
+from collections import deque
+from datetime import datetime
+import time
+from typing import Any
+
+DEFAULT_FRAME_HISTORY = 64
+
+TX = "tx"
+RX = "rx"
+
+
+class FrameRecorder:
+    """Fixed-size ring buffer of raw frames sent to and received from a device.
+
+    Recording only stores a timestamp and a reference to the raw bytes, so it
+    is cheap enough to leave on permanently. Frames are formatted when the
+    buffer is read.
+    """
+
+    def __init__(self, maxlen: int = DEFAULT_FRAME_HISTORY) -> None:
+        """Frame recorder constructor."""
+        self._frames: deque[tuple[float, str, bytes, bool]] = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def record(self, direction: str, data: bytes, secret: bool = False) -> None:
+        """Record a raw frame. Secret frames are never formatted."""
+        self._frames.append((time.time(), direction, data, secret))
+
+    def clear(self) -> None:
+        self._frames.clear()
+
+    def as_dicts(self) -> list[dict[str, Any]]:
+        """Return the recorded frames, oldest first."""
+        return [
+            {
+                "time": datetime.fromtimestamp(ts).isoformat(timespec="milliseconds"),
+                "direction": direction,
+                "data": _format_frame(data, secret),
+            }
+            for ts, direction, data, secret in list(self._frames)
+        ]
+
+    def __str__(self) -> str:
+        if not self._frames:
+            return "  (no frames recorded)"
+        return "\n".join(
+            f"  {frame['time']} {frame['direction']} {frame['data']}"
+            for frame in self.as_dicts()
+        )
+
+
+def _format_frame(data: bytes, secret: bool) -> str:
+    if secret:
+        return f"<{len(data)} bytes redacted>"
+    return bytes(data).hex(":")
@@ -0,0 +1,151 @@
+"""Priority lanes for MicroBot commands."""
+from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+import heapq
+import itertools
+import time
+from typing import Any, AsyncIterator
+
+
+class Priority(IntEnum):
+    """Command priority classes, most urgent first."""
+
+    INTERACTIVE = 0
+    AUTOMATION = 1
+    MAINTENANCE = 2
+
+
+@dataclass
+class LaneStats:
+    """Wait time metrics for one priority lane."""
+
+    count: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    last_wait: float = 0.0
+
+    def record(self, wait: float) -> None:
+        self.count += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean_wait": self.total_wait / self.count if self.count else 0.0,
+            "max_wait": self.max_wait,
+            "last_wait": self.last_wait,
+        }
+
+
+class PriorityLock:
+    """Lock that is handed to the most urgent waiter on release.
+
+    Waiters of equal priority are served in arrival order. A holder doing
+    long running work can call `checkpoint` between steps to let more
+    urgent waiters go first. With a `limit` above one, up to that many
+    holders run at once, like a semaphore.
+    """
+
+    def __init__(self, limit: int = 1) -> None:
+        """Priority lock constructor."""
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        self._limit = limit
+        self._holders = 0
+        self._waiters: list[list[Any]] = []
+        self._counter = itertools.count()
+        self.stats = {priority: LaneStats() for priority in Priority}
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def locked(self) -> bool:
+        return self._holders >= self._limit
+
+    def has_waiter_above(self, priority: Priority) -> bool:
+        """Return true if a more urgent acquire is queued."""
+        return any(
+            entry[0] < priority and not entry[2].done() for entry in self._waiters
+        )
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        start = time.monotonic()
+        if self.locked() or self._waiters:
+            future = asyncio.get_running_loop().create_future()
+            entry = [priority, next(self._counter), future]
+            heapq.heappush(self._waiters, entry)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The lock was handed over just as we were cancelled.
+                    self.release()
+                elif entry in self._waiters:
+                    # A release may already have skipped past our entry.
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                raise
+        else:
+            self._holders += 1
+        self.stats[priority].record(time.monotonic() - start)
+
+    def release(self) -> None:
+        if not self._holders:
+            raise RuntimeError("Lock is not acquired.")
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Ownership passes straight to the waiter.
+                future.set_result(True)
+                return
+        self._holders -= 1
+
+    async def checkpoint(self, priority: Priority) -> bool:
+        """Let more urgent waiters run before continuing at `priority`.
+
+        Returns true if the lock was handed over in between. The lock is
+        held again on return, even when cancelled, so the caller's release
+        stays balanced.
+        """
+        if not self.has_waiter_above(priority):
+            return False
+        # Queue ahead of waiters of the same priority, the holder keeps its turn.
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, -next(self._counter), future])
+        self.release()
+        cancelled = False
+        while not future.done():
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                cancelled = True
+        if cancelled:
+            raise asyncio.CancelledError
+        return True
+
+    @asynccontextmanager
+    async def hold(self, priority: Priority = Priority.INTERACTIVE) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *args: Any) -> None:
+        self.release()
+
+    def stats_as_dict(self) -> dict[str, Any]:
+        return {
+            priority.name.lower(): stats.as_dict()
+            for priority, stats in self.stats.items()
+        }
@@ -1,31 +1,65 @@
 """Switch platform for MicroBot."""
+import voluptuous as vol
 from homeassistant.components.switch import SwitchEntity
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_platform
 from homeassistant.helpers.restore_state import RestoreEntity
 from .const import DEFAULT_NAME, DOMAIN, ICON, SWITCH
+from .api import NotCalibratedError
 from .entity import MicroBotEntity
+from .scheduler import Priority
+
+ATTR_DEPTH = "depth"
+ATTR_DURATION = "duration"
+PUSH_SCHEMA = {
+    vol.Optional(ATTR_DEPTH): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+    vol.Optional(ATTR_DURATION): vol.All(vol.Coerce(int), vol.Range(min=0)),
+}
 
 async def async_setup_entry(hass, entry, async_add_devices):
     """Setup switch platform."""
     coordinator = hass.data[DOMAIN][entry.entry_id]
     async_add_devices([MicroBotBinarySwitch(coordinator, entry)])
 
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service("push_on", PUSH_SCHEMA, "async_push_on")
+    platform.async_register_entity_service("push_off", PUSH_SCHEMA, "async_push_off")
+
 class MicroBotBinarySwitch(MicroBotEntity, SwitchEntity, RestoreEntity):
     """MicroBot switch class."""
 
     async def async_turn_on(self, **kwargs):  # pylint: disable=unused-argument
         """Turn on the switch."""
-        await self.coordinator.api.connect()
-        await self.coordinator.api.push_on()
-        await self.coordinator.api.disconnect()
+        await self.coordinator.async_push(True, self._priority)
         self.async_write_ha_state()
         
     async def async_turn_off(self, **kwargs):  # pylint: disable=unused-argument
         """Turn off the switch."""
-        await self.coordinator.api.connect()
-        await self.coordinator.api.push_off()
-        await self.coordinator.api.disconnect()
+        await self.coordinator.async_push(False, self._priority)
+        self.async_write_ha_state()
+
+    async def async_push_on(self, depth=None, duration=None):
+        """Turn on the switch, optionally with a different depth or hold."""
+        await self._async_push(True, depth, duration)
+
+    async def async_push_off(self, depth=None, duration=None):
+        """Turn off the switch, optionally with a different depth or hold."""
+        await self._async_push(False, depth, duration)
+
+    async def _async_push(self, on, depth, duration):
+        try:
+            await self.coordinator.async_push(on, self._priority, depth, duration)
+        except NotCalibratedError as e:
+            raise HomeAssistantError(str(e)) from e
         self.async_write_ha_state()
 
+    @property
+    def _priority(self) -> Priority:
+        """Presses made by a user go ahead of automations."""
+        if self._context is not None and self._context.user_id is not None:
+            return Priority.INTERACTIVE
+        return Priority.AUTOMATION
+
     @property
     def name(self):
         """Return the name of the switch."""
@@ -41,6 +75,13 @@ class MicroBotBinarySwitch(MicroBotEntity, SwitchEntity, RestoreEntity):
         """Return true if the switch is on."""
         return self.coordinator.api.is_on
 
+    @property
+    def extra_state_attributes(self):
+        """Return pre-connect statistics when enabled."""
+        if (stats := self.coordinator.preconnect_stats) is None:
+            return None
+        return {"preconnect_hit_rate": stats["hit_rate"]}
+
     @property
     def available(self) -> bool:
         return True
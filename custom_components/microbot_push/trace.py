@@ -0,0 +1,116 @@
+"""Command trace recording for MicroBot."""
+from __future__ import annotations
+import asyncio
+import csv
+from dataclasses import dataclass
+import logging
+import time
+from typing import Iterator
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
+
+FLUSH_SIZE = 50
+FIELDS = ("time", "address", "command", "priority", "queued", "latency", "ok")
+
+
+@dataclass
+class TraceRow:
+    """One command as it was seen in production."""
+
+    time: float
+    address: str
+    command: str
+    priority: str
+    queued: float
+    latency: float
+    ok: bool
+
+
+class TraceRecorder:
+    """Append commands to a compact CSV trace.
+
+    Rows are buffered in memory and written in the executor, so recording
+    doesn't block the event loop. Flushes run one at a time, in order.
+    """
+
+    def __init__(self, path: str, flush_size: int = FLUSH_SIZE) -> None:
+        """Trace recorder constructor."""
+        self._path = path
+        self._flush_size = flush_size
+        self._rows: list[tuple] = []
+        self._flushing: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def record(
+        self,
+        address: str,
+        command: str,
+        priority: str,
+        started: float,
+        acquired: float,
+        finished: float,
+        ok: bool,
+    ) -> None:
+        """Record a command, timings are from time.monotonic()."""
+        self._rows.append(
+            (
+                time.time() - (finished - started),
+                address,
+                command,
+                priority,
+                acquired - started,
+                finished - acquired,
+                ok,
+            )
+        )
+        if len(self._rows) >= self._flush_size and (
+            self._flushing is None or self._flushing.done()
+        ):
+            self._flushing = asyncio.ensure_future(self.async_flush())
+
+    async def async_flush(self) -> None:
+        """Write buffered rows to the trace file."""
+        async with self._flush_lock:
+            rows, self._rows = self._rows, []
+            if rows:
+                await asyncio.get_running_loop().run_in_executor(None, self._append, rows)
+
+    def _append(self, rows: list[tuple]) -> None:
+        try:
+            with open(self._path, "a", newline="") as file:
+                writer = csv.writer(file)
+                if file.tell() == 0:
+                    writer.writerow(FIELDS)
+                writer.writerows(
+                    (
+                        f"{ts:.3f}",
+                        address,
+                        command,
+                        priority,
+                        f"{queued:.4f}",
+                        f"{latency:.4f}",
+                        int(ok),
+                    )
+                    for ts, address, command, priority, queued, latency, ok in rows
+                )
+        except OSError as e:
+            _LOGGER.error("Failed to write trace: %s", e)
+
+
+def read_trace(path: str) -> Iterator[TraceRow]:
+    """Read a trace written by TraceRecorder."""
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            yield TraceRow(
+                time=float(row["time"]),
+                address=row["address"],
+                command=row["command"],
+                priority=row["priority"],
+                queued=float(row["queued"]),
+                latency=float(row["latency"]),
+                ok=row["ok"] == "1",
+            )
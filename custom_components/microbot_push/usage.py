@@ -0,0 +1,96 @@
+"""Usage pattern learning for MicroBot."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Any
+
+DEFAULT_SLOT_MINUTES = 15
+DEFAULT_HALF_LIFE = timedelta(days=28)
+DEFAULT_THRESHOLD = 2.0
+
+
+class UsageHistogram:
+    """Decaying histogram of command times by weekday and time of day.
+
+    Each weekday is split into fixed slots. Every recorded command adds one
+    to its slot and older counts decay with the configured half life, so a
+    slot stays likely only while the routine keeps recurring.
+    """
+
+    def __init__(
+        self,
+        slot_minutes: int = DEFAULT_SLOT_MINUTES,
+        half_life: timedelta = DEFAULT_HALF_LIFE,
+        threshold: float = DEFAULT_THRESHOLD,
+    ) -> None:
+        """Usage histogram constructor."""
+        self._slot_minutes = slot_minutes
+        self._half_life = half_life.total_seconds()
+        self._threshold = threshold
+        self._slots = 24 * 60 // slot_minutes
+        self._weights = [[0.0] * self._slots for _ in range(7)]
+        self._updated: float | None = None
+
+    def _slot(self, when: datetime) -> tuple[int, int]:
+        return when.weekday(), (when.hour * 60 + when.minute) // self._slot_minutes
+
+    def _decay(self, when: datetime) -> float:
+        if self._updated is None:
+            return 1.0
+        elapsed = max(0.0, when.timestamp() - self._updated)
+        return 0.5 ** (elapsed / self._half_life)
+
+    def record(self, when: datetime) -> None:
+        """Record a command sent at `when`."""
+        factor = self._decay(when)
+        if factor != 1.0:
+            self._weights = [[w * factor for w in day] for day in self._weights]
+        day, slot = self._slot(when)
+        self._weights[day][slot] += 1.0
+        self._updated = when.timestamp()
+
+    def weight(self, when: datetime) -> float:
+        """Return the decayed weight of the slot containing `when`."""
+        day, slot = self._slot(when)
+        return self._weights[day][slot] * self._decay(when)
+
+    def likely(self, when: datetime) -> bool:
+        """Return true if a command is likely in the slot containing `when`."""
+        return self.weight(when) >= self._threshold
+
+    def slot_end(self, when: datetime) -> datetime:
+        """Return the end of the slot containing `when`."""
+        start = when.replace(second=0, microsecond=0) - timedelta(
+            minutes=when.minute % self._slot_minutes
+        )
+        return start + timedelta(minutes=self._slot_minutes)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "slot_minutes": self._slot_minutes,
+            "updated": self._updated,
+            "weights": self._weights,
+        }
+
+    def load(self, data: dict[str, Any]) -> None:
+        """Restore a histogram saved with `as_dict`.
+
+        Data saved with another slot size, or of the wrong shape, is ignored.
+        """
+        if data.get("slot_minutes") != self._slot_minutes:
+            return
+        weights = data.get("weights")
+        updated = data.get("updated")
+        if (
+            not isinstance(weights, list)
+            or len(weights) != 7
+            or any(
+                not isinstance(day, list)
+                or len(day) != self._slots
+                or not all(isinstance(w, (int, float)) for w in day)
+                for day in weights
+            )
+            or not (updated is None or isinstance(updated, (int, float)))
+        ):
+            return
+        self._updated = updated
+        self._weights = [[float(w) for w in day] for day in weights]
@@ -0,0 +1,289 @@
+"""Benchmark MicroBot import time and per-entry setup time.
+
+Measures, without a Bluetooth adapter:
+
+- import time of the integration's client modules, in a fresh interpreter
+- time to create N clients, which must not touch the disk
+- time until all N clients have loaded their token files
+- the longest the event loop was blocked while doing so
+
+When Home Assistant is installed, it also measures the setup path:
+
+- import time of the coordinator, config flow and platform modules, with
+  Home Assistant itself already imported
+- time for async_setup_entry to return for N config entries, and until
+  all of them have loaded their token files
+- the longest the event loop was blocked while doing so
+
+The Bluetooth device lookup is answered locally. Forwarding to the switch
+platform is recorded rather than run, since that needs Home Assistant's
+loader and registries.
+
+Usage:
+    python scripts/bench_startup.py --entries 50
+    python scripts/bench_startup.py --entries 50 --save baseline.json
+    python scripts/bench_startup.py --entries 50 --compare baseline.json
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODULES = [
+    "custom_components.microbot_push",
+    "custom_components.microbot_push.api",
+    "custom_components.microbot_push.fleet",
+]
+HA_MODULES = [
+    "custom_components.microbot_push.coordinator",
+    "custom_components.microbot_push.config_flow",
+    "custom_components.microbot_push.switch",
+    "custom_components.microbot_push.diagnostics",
+]
+# Imported before the timer starts, they are Home Assistant's cost, not ours.
+HA_PRELOAD = [
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.components.bluetooth",
+    "homeassistant.components.diagnostics",
+    "homeassistant.components.switch",
+]
+IMPORT_SNIPPET = """
+import time
+{preload}
+start = time.perf_counter()
+import {modules}
+print(time.perf_counter() - start)
+"""
+
+
+def has_home_assistant() -> bool:
+    try:
+        import homeassistant.core  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def bench_import(runs: int, modules: list[str] = MODULES, preload: list[str] = ()) -> float:
+    """Return the median cold import time in seconds."""
+    code = IMPORT_SNIPPET.format(
+        modules=", ".join(modules),
+        preload="\n".join(f"import {module}" for module in preload),
+    )
+    times = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        times.append(float(out.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+async def _watch_loop(stop: asyncio.Event, interval: float = 0.001) -> float:
+    """Return the longest delay seen between event loop iterations."""
+    worst = 0.0
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - before - interval)
+    return worst
+
+
+async def bench_setup(entries: int, token_dir: str) -> dict[str, float]:
+    """Create and load `entries` clients."""
+    from custom_components.microbot_push.api import MicroBotApiClient, token_path
+
+    addresses = [f"AA:BB:CC:00:{i // 256:02X}:{i % 256:02X}" for i in range(entries)]
+    for address in addresses:
+        bdaddr = address.lower().replace(":", "")
+        with open(token_path(token_dir, address), "w") as file:
+            file.write(f"[tokens]\n{bdaddr} = {'0' * 32}\n")
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    clients = [
+        MicroBotApiClient(
+            device=SimpleNamespace(address=address, name="mibp"),
+            config=token_path(token_dir, address),
+        )
+        for address in addresses
+    ]
+    created = time.perf_counter()
+    await asyncio.gather(*(client.async_load() for client in clients))
+    ready = time.perf_counter()
+    stop.set()
+    max_block = await watcher
+    assert all(client.hasToken() for client in clients)
+    return {
+        "create_s": created - start,
+        "ready_s": ready - start,
+        "max_loop_block_s": max_block,
+    }
+
+
+class _Entry:
+    """Just enough of a ConfigEntry for async_setup_entry."""
+
+    def __init__(self, index: int, address: str) -> None:
+        from custom_components.microbot_push.const import (
+            CONF_BDADDR,
+            CONF_NAME,
+            CONF_RETRY_COUNT,
+            DEFAULT_RETRY_COUNT,
+        )
+
+        self.entry_id = f"bench{index}"
+        self.unique_id = address.replace(":", "").lower()
+        self.data = {CONF_BDADDR: address, CONF_NAME: f"MicroBot {index}"}
+        self.options = {CONF_RETRY_COUNT: DEFAULT_RETRY_COUNT}
+        self.on_unload: list = []
+
+    def async_on_unload(self, func) -> None:
+        self.on_unload.append(func)
+
+    def add_update_listener(self, listener):
+        return lambda: None
+
+
+class _ConfigEntries:
+    """Records platform forwards instead of setting the platforms up."""
+
+    def __init__(self) -> None:
+        self.forwarded: list[tuple[str, str]] = []
+
+    async def async_forward_entry_setup(self, entry: _Entry, platform: str) -> bool:
+        self.forwarded.append((entry.entry_id, platform))
+        return True
+
+
+async def bench_setup_entries(entries: int, config_dir: str) -> dict[str, float]:
+    """Run async_setup_entry for `entries` config entries."""
+    from unittest.mock import patch
+
+    from homeassistant.components import bluetooth
+    from homeassistant.core import HomeAssistant
+
+    from custom_components.microbot_push import async_setup_entry
+    from custom_components.microbot_push.api import token_path
+    from custom_components.microbot_push.const import DOMAIN, PLATFORMS
+
+    try:
+        hass = HomeAssistant(config_dir)
+    except TypeError:
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    hass.config_entries = _ConfigEntries()
+    storage = hass.config.path(".storage")
+    os.makedirs(storage, exist_ok=True)
+    addresses = [f"AA:BB:CC:01:{i // 256:02X}:{i % 256:02X}" for i in range(entries)]
+    for address in addresses:
+        bdaddr = address.lower().replace(":", "")
+        with open(token_path(storage, address), "w") as file:
+            file.write(f"[tokens]\n{bdaddr} = {'0' * 32}\n")
+    devices = {
+        address: SimpleNamespace(address=address, name="mibp", rssi=-60)
+        for address in addresses
+    }
+    config_entries = [_Entry(index, address) for index, address in enumerate(addresses)]
+
+    def _ble_device(hass, address, connectable=True):
+        return devices.get(address)
+
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_loop(stop))
+    await asyncio.sleep(0)
+    with patch.object(bluetooth, "async_ble_device_from_address", _ble_device):
+        start = time.perf_counter()
+        # Home Assistant sets config entries up concurrently.
+        assert all(
+            await asyncio.gather(
+                *(async_setup_entry(hass, entry) for entry in config_entries)
+            )
+        )
+        setup = time.perf_counter()
+        await hass.async_block_till_done()
+        clients = [hass.data[DOMAIN][entry.entry_id].api for entry in config_entries]
+        await asyncio.gather(*(client.async_load() for client in clients))
+        ready = time.perf_counter()
+    stop.set()
+    max_block = await watcher
+    assert all(client.hasToken() for client in clients)
+    assert len(hass.config_entries.forwarded) == entries * len(PLATFORMS)
+    return {
+        "ha_setup_s": setup - start,
+        "ha_ready_s": ready - start,
+        "ha_max_loop_block_s": max_block,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5, help="import runs")
+    parser.add_argument("--save", help="write results to this file")
+    parser.add_argument("--compare", help="fail if slower than this baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="allowed slowdown against the baseline (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    results = {"entries": args.entries, "import_s": bench_import(args.runs)}
+    with tempfile.TemporaryDirectory() as token_dir:
+        results.update(asyncio.run(bench_setup(args.entries, token_dir)))
+    if has_home_assistant():
+        results["ha_import_s"] = bench_import(args.runs, HA_MODULES, HA_PRELOAD)
+        with tempfile.TemporaryDirectory() as config_dir:
+            results.update(asyncio.run(bench_setup_entries(args.entries, config_dir)))
+    else:
+        print("Home Assistant isn't installed, skipping the setup path", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = [
+            key
+            for key in (
+                "import_s",
+                "create_s",
+                "ready_s",
+                "max_loop_block_s",
+                "ha_import_s",
+                "ha_setup_s",
+                "ha_ready_s",
+                "ha_max_loop_block_s",
+            )
+            if key in baseline and key in results
+            and results[key] > baseline[key] * (1 + args.tolerance)
+        ]
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
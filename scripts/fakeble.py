@@ -0,0 +1,199 @@
+"""Local stand-in for bleak and bleak_retry_connector.
+
+`install()` registers fake `bleak` and `bleak_retry_connector` modules so
+that MicroBotApiClient talks to simulated MicroBot peripherals instead of
+a Bluetooth adapter. The client imports bleak lazily, so installing
+before the first connect is enough.
+
+Each simulated peripheral acknowledges every write with a notification,
+and links can be dropped at random to exercise the failure paths.
+"""
+from __future__ import annotations
+import asyncio
+import random
+import sys
+import types
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+FIRMWARE = b"1.0.0"
+
+
+class FakeBleakError(Exception):
+    """Stand-in for bleak.BleakError."""
+
+
+@dataclass
+class FakeBLEDevice:
+    """Stand-in for bleak.backends.device.BLEDevice."""
+
+    address: str
+    name: str = "mibp"
+    rssi: int = -60
+
+
+@dataclass
+class FakeAdvertisementData:
+    """Stand-in for bleak.backends.scanner.AdvertisementData."""
+
+    local_name: str = "mibp"
+    service_uuids: list[str] = field(default_factory=list)
+    manufacturer_data: dict[int, bytes] = field(default_factory=dict)
+
+
+@dataclass
+class LinkProfile:
+    """Behaviour of the simulated links."""
+
+    connect_delay: float = 0.0
+    write_delay: float = 0.0
+    ack_delay: float = 0.0
+    connect_failure_rate: float = 0.0
+    notify_failure_rate: float = 0.0
+    drop_rate: float = 0.0
+    # Ignore value frames written without response, like firmware that
+    # needs acknowledged writes.
+    ignore_unacknowledged_values: bool = False
+    # Refuse writes without response, like BlueZ does when the
+    # characteristic lacks that property.
+    reject_unacknowledged_writes: bool = False
+    # Fail firmware revision reads.
+    firmware_read_fails: bool = False
+
+
+class FakeBleakClient:
+    """Simulated connection to one MicroBot."""
+
+    instances: "weakref.WeakSet[FakeBleakClient]" = weakref.WeakSet()
+    profile = LinkProfile()
+    rng = random.Random(0)
+
+    def __init__(
+        self,
+        device: FakeBLEDevice,
+        disconnected_callback: Callable[[Any], None] | None = None,
+    ) -> None:
+        self.address = device.address
+        self._disconnected_callback = disconnected_callback
+        self._connected = False
+        self._notify: dict[str, Callable] = {}
+        self.writes = 0
+        FakeBleakClient.instances.add(self)
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @property
+    def subscriptions(self) -> int:
+        return len(self._notify)
+
+    async def connect(self) -> None:
+        await asyncio.sleep(self.profile.connect_delay)
+        if self.rng.random() < self.profile.connect_failure_rate:
+            raise FakeBleakError(f"{self.address}: connection failed")
+        self._connected = True
+
+    async def disconnect(self) -> bool:
+        if self._connected:
+            self._drop()
+        return True
+
+    def _drop(self) -> None:
+        self._connected = False
+        self._notify.clear()
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    async def start_notify(self, char: str, callback: Callable) -> None:
+        self._check()
+        if self.rng.random() < self.profile.notify_failure_rate:
+            raise FakeBleakError(f"{self.address}: start_notify failed")
+        self._notify[char] = callback
+
+    async def stop_notify(self, char: str) -> None:
+        self._check()
+        self._notify.pop(char, None)
+
+    async def read_gatt_char(self, char: str) -> bytearray:
+        self._check()
+        if self.profile.firmware_read_fails:
+            raise FakeBleakError(f"{self.address}: read failed")
+        return bytearray(FIRMWARE)
+
+    async def write_gatt_char(self, char: str, data: bytearray, response: bool = False) -> None:
+        self._check()
+        if self.rng.random() < self.profile.drop_rate:
+            asyncio.get_running_loop().call_soon(self._drop)
+            await asyncio.sleep(self.profile.write_delay + 1)
+            return
+        if not response and self.profile.reject_unacknowledged_writes:
+            raise FakeBleakError(f"{self.address}: write without response not supported")
+        await asyncio.sleep(self.profile.write_delay if response else 0)
+        if (
+            not response
+            and self.profile.ignore_unacknowledged_values
+            and bytes(data[2:4]) == b"\x0f\xff"
+        ):
+            return
+        self.writes += 1
+        if (callback := self._notify.get(char)) is not None:
+            asyncio.get_running_loop().call_later(
+                self.profile.ack_delay, self._deliver, callback, bytes(data[:2]) + b"\x01\x00"
+            )
+
+    def _deliver(self, callback: Callable, data: bytes) -> None:
+        if not self._connected:
+            return
+        result = callback(0, bytearray(data))
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+    def _check(self) -> None:
+        if not self._connected:
+            raise FakeBleakError(f"{self.address}: not connected")
+
+
+async def establish_connection(
+    client_class: type,
+    device: FakeBLEDevice,
+    name: str,
+    disconnected_callback: Callable[[Any], None] | None = None,
+    max_attempts: int = 1,
+    **kwargs: Any,
+) -> FakeBleakClient:
+    """Stand-in for bleak_retry_connector.establish_connection."""
+    error: Exception | None = None
+    for _ in range(max(1, max_attempts)):
+        client = client_class(device, disconnected_callback)
+        try:
+            await client.connect()
+        except FakeBleakError as e:
+            error = e
+            continue
+        return client
+    raise error
+
+
+def open_clients() -> int:
+    """Return the number of simulated links currently up."""
+    return sum(1 for client in list(FakeBleakClient.instances) if client.is_connected)
+
+
+def subscriptions() -> int:
+    """Return the number of notification subscriptions held open."""
+    return sum(client.subscriptions for client in list(FakeBleakClient.instances))
+
+
+def install() -> None:
+    """Register the fake bleak modules."""
+    bleak = types.ModuleType("bleak")
+    bleak.BleakError = FakeBleakError
+    bleak.BleakClient = FakeBleakClient
+    bleak.BleakScanner = None
+    retry = types.ModuleType("bleak_retry_connector")
+    retry.BleakClient = FakeBleakClient
+    retry.establish_connection = establish_connection
+    sys.modules["bleak"] = bleak
+    sys.modules["bleak_retry_connector"] = retry
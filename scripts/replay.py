@@ -0,0 +1,223 @@
+"""Replay a recorded command trace against simulated MicroBots.
+
+Reads a trace written by the integration's "Record a command trace"
+option, creates one MicroBotApiClient per recorded device, and issues
+each command at its recorded offset, at 1x or accelerated speed. Every
+command runs through the client's priority lanes, exactly like the
+coordinator does, so scheduling and connection changes can be checked
+against production-shaped load.
+
+Reports, for the replay and for the recording it came from:
+
+- queueing delay: from when the command was due until its lane was free
+- push latency: from the lane being free until a push finished, with the
+  latency of each command reported separately
+- failures
+
+Usage:
+    python scripts/replay.py microbot_push.trace.csv
+    python scripts/replay.py microbot_push.trace.csv --speed 10 --connect-delay 0.8
+    python scripts/replay.py --sample sample.csv
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fakeble  # noqa: E402
+
+fakeble.install()
+
+from custom_components.microbot_push import api  # noqa: E402
+from custom_components.microbot_push.trace import FIELDS, TraceRow, read_trace  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+COMMANDS = ("push_on", "push_off", "calibrate", "generate_token")
+PUSHES = ("push_on", "push_off")
+
+
+def percentiles(values: list[float]) -> dict[str, float] | None:
+    """Return nearest-rank percentiles and the maximum, in seconds."""
+    if not values:
+        return None
+    values = sorted(values)
+    result = {
+        f"p{p}": round(values[min(len(values) - 1, max(0, -(-p * len(values) // 100) - 1))], 4)
+        for p in PERCENTILES
+    }
+    result["max"] = round(values[-1], 4)
+    return result
+
+
+def summary(
+    queued: list[float], latency: dict[str, list[float]], failed: int, total: int
+) -> dict:
+    """Summarize a run, `latency` holds the latencies of each command."""
+    return {
+        "commands": total,
+        "failed": failed,
+        "queued_s": percentiles(queued),
+        "push_latency_s": percentiles(
+            [value for command in PUSHES for value in latency.get(command, [])]
+        ),
+        "latency_s": {
+            command: percentiles(latency[command]) for command in COMMANDS if command in latency
+        },
+    }
+
+
+def by_command(rows: list[TraceRow]) -> dict[str, list[float]]:
+    """Return the recorded latencies of each command."""
+    latency: dict[str, list[float]] = {}
+    for row in rows:
+        latency.setdefault(row.command, []).append(row.latency)
+    return latency
+
+
+async def run_command(client: api.MicroBotApiClient, command: str) -> bool:
+    """Issue one recorded command the way the integration does."""
+    if command == "generate_token":
+        await client.connect(init=True)
+        ok = client.is_connected()
+    else:
+        await client.connect()
+        if command == "push_on":
+            ok = await client.push_on()
+        elif command == "push_off":
+            ok = await client.push_off()
+        else:
+            ok = await client.calibrate()
+    await client.disconnect()
+    return ok
+
+
+async def replay(rows: list[TraceRow], args: argparse.Namespace) -> dict:
+    fakeble.FakeBleakClient.rng = random.Random(args.seed)
+    fakeble.FakeBleakClient.profile = fakeble.LinkProfile(
+        connect_delay=args.connect_delay,
+        write_delay=args.write_delay,
+        ack_delay=args.ack_delay,
+        connect_failure_rate=args.connect_failure_rate,
+        drop_rate=args.drop_rate,
+    )
+    token_dir = tempfile.mkdtemp()
+    clients: dict[str, api.MicroBotApiClient] = {}
+    for address in sorted({row.address for row in rows}):
+        with open(api.token_path(token_dir, address), "w") as file:
+            file.write(f"[tokens]\n{address.lower().replace(':', '')} = {'0' * 32}\n")
+        clients[address] = api.MicroBotApiClient(
+            device=fakeble.FakeBLEDevice(address),
+            config=api.token_path(token_dir, address),
+            retry_count=args.retry_count,
+        )
+
+    queued: list[float] = []
+    latency: dict[str, list[float]] = {}
+    failed = 0
+    t0 = rows[0].time
+    start = time.monotonic()
+
+    async def issue(row: TraceRow) -> None:
+        nonlocal failed
+        due = start + (row.time - t0) / args.speed
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+        client = clients[row.address]
+        ok = False
+        async with client.lane(api.Priority[row.priority.upper()]):
+            acquired = time.monotonic()
+            try:
+                ok = await run_command(client, row.command)
+            finally:
+                queued.append(acquired - due)
+                latency.setdefault(row.command, []).append(time.monotonic() - acquired)
+                failed += not ok
+
+    await asyncio.gather(*(issue(row) for row in rows))
+    return {
+        "duration_s": round(time.monotonic() - start, 3),
+        **summary(queued, latency, failed, len(rows)),
+    }
+
+
+def write_sample(path: str, devices: int, bursts: int, seed: int) -> None:
+    """Write a synthetic trace: bursts of automations across many bots."""
+    rng = random.Random(seed)
+    addresses = [f"AA:BB:CC:DD:00:{i:02X}" for i in range(devices)]
+    ts = time.time()
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        for _ in range(bursts):
+            ts += rng.uniform(1, 30)
+            for address in rng.sample(addresses, k=rng.randint(1, devices)):
+                for command in ("push_on", "push_off")[: rng.randint(1, 2)]:
+                    writer.writerow(
+                        (
+                            f"{ts + rng.uniform(0, 0.5):.3f}",
+                            address,
+                            command,
+                            "interactive" if rng.random() < 0.1 else "automation",
+                            f"{rng.uniform(0, 0.2):.4f}",
+                            f"{rng.uniform(1, 3):.4f}",
+                            int(rng.random() > 0.02),
+                        )
+                    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", nargs="?", help="trace file to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time")
+    parser.add_argument("--connect-delay", type=float, default=0.5)
+    parser.add_argument("--write-delay", type=float, default=0.05)
+    parser.add_argument("--ack-delay", type=float, default=0.02)
+    parser.add_argument("--connect-failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--retry-count", type=int, default=api.DEFAULT_RETRY_COUNT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample", metavar="PATH", help="write a synthetic trace to PATH and exit")
+    parser.add_argument("--sample-devices", type=int, default=24)
+    parser.add_argument("--sample-bursts", type=int, default=10)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    import logging
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+
+    if args.sample:
+        write_sample(args.sample, args.sample_devices, args.sample_bursts, args.seed)
+        return 0
+    if not args.trace:
+        parser.error("a trace file is required")
+    recorded = sorted(read_trace(args.trace), key=lambda row: row.time)
+    rows = [row for row in recorded if row.command in COMMANDS]
+    if not rows:
+        parser.error(f"{args.trace} has no commands to replay")
+
+    results = {
+        "trace": args.trace,
+        "speed": args.speed,
+        "skipped": len(recorded) - len(rows),
+        "recorded": summary(
+            [row.queued for row in rows],
+            by_command(rows),
+            sum(not row.ok for row in rows),
+            len(rows),
+        ),
+        "replayed": asyncio.run(replay(rows, args)),
+    }
+    print(json.dumps(results, indent=2))
+    return 1 if results["replayed"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Soak test the MicroBot client against simulated peripherals.
+
+Runs thousands of connect/push/disconnect cycles, with random link drops
+and notification failures, plus advertisement cycles through
+GetMicroBotDevices and the advertisement change detection. Memory, live
+object counts, open links, notification subscriptions and pending tasks
+are sampled along the way. The run fails if any of them keeps growing.
+
+Usage:
+    python scripts/soak.py --devices 8 --cycles 5000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fakeble  # noqa: E402
+
+fakeble.install()
+
+from custom_components.microbot_push import api  # noqa: E402
+
+# Allowed growth between the start and the end of the run.
+MEMORY_SLACK = 512 * 1024
+COUNT_SLACK = 0.10
+
+
+def _count(kind: type) -> int:
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, kind))
+
+
+def sample(clients: list[api.MicroBotApiClient], scanner: api.GetMicroBotDevices) -> dict[str, int]:
+    gc.collect()
+    return {
+        "memory": tracemalloc.get_traced_memory()[0],
+        "clients": _count(api.MicroBotApiClient),
+        "fake_clients": len(fakeble.FakeBleakClient.instances),
+        "futures": _count(asyncio.Future),
+        "open_links": fakeble.open_clients(),
+        "subscriptions": fakeble.subscriptions(),
+        "pending_tasks": len(asyncio.all_tasks()) - 1,
+        "advertisements": len(scanner._adv_data),
+        "frames": sum(len(client.frames) for client in clients),
+    }
+
+
+def grown(samples: list[dict[str, int]], key: str) -> bool:
+    """Compare the first and last third of the samples."""
+    third = max(1, len(samples) // 3)
+    start = statistics.median(s[key] for s in samples[:third])
+    end = statistics.median(s[key] for s in samples[-third:])
+    slack = MEMORY_SLACK if key == "memory" else max(2, start * COUNT_SLACK)
+    return end > start + slack
+
+
+def advertisement(rng: random.Random, address: str, counter: int):
+    device = fakeble.FakeBLEDevice(address)
+    adv = fakeble.FakeAdvertisementData(
+        service_uuids=[api.SVC1831],
+        manufacturer_data={1280: bytes([counter % 256, rng.randrange(2)])},
+    )
+    return device, adv
+
+
+async def device_cycle(
+    client: api.MicroBotApiClient, rng: random.Random, stats: dict[str, int]
+) -> None:
+    async with client.lane(rng.choice(list(api.Priority))):
+        await client.connect()
+        if rng.random() < 0.2:
+            ok = await client.push_on(depth=rng.randrange(101), duration=rng.randrange(3))
+        else:
+            ok = await (client.push_on() if rng.random() < 0.5 else client.push_off())
+        stats["ok" if ok else "failed"] += 1
+        if rng.random() < 0.9:
+            await client.disconnect()
+
+
+async def soak(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    fakeble.FakeBleakClient.rng = random.Random(args.seed)
+    fakeble.FakeBleakClient.profile = fakeble.LinkProfile(
+        drop_rate=args.drop_rate,
+        notify_failure_rate=args.notify_failure_rate,
+        connect_failure_rate=args.connect_failure_rate,
+    )
+    token_dir = tempfile.mkdtemp()
+    addresses = [f"AA:BB:CC:DD:00:{i:02X}" for i in range(args.devices)]
+    for address in addresses:
+        with open(api.token_path(token_dir, address), "w") as file:
+            bdaddr = address.lower().replace(':', '')
+            file.write(f"[tokens]\n{bdaddr} = {'0' * 32}\n")
+            # Calibrated, so pushes can override depth and duration.
+            file.write(f"[settings]\n{bdaddr}_mode = 0\n{bdaddr}_depth = 50\n{bdaddr}_duration = 0\n")
+    clients = [
+        api.MicroBotApiClient(
+            device=fakeble.FakeBLEDevice(address),
+            config=api.token_path(token_dir, address),
+            retry_count=1,
+            auto_reconnect=index % 2 == 0,
+        )
+        for index, address in enumerate(addresses)
+    ]
+    scanner = api.GetMicroBotDevices()
+    stats = {"ok": 0, "failed": 0}
+    samples = []
+    tracemalloc.start()
+
+    for cycle in range(1, args.cycles + 1):
+        await asyncio.gather(
+            *(device_cycle(client, rng, stats) for client in rng.sample(clients, k=max(1, len(clients) // 2)))
+        )
+        for _ in range(args.advertisements):
+            # Mostly known bots, some never seen before.
+            address = rng.choice(addresses) if rng.random() < 0.8 else (
+                f"11:22:33:{rng.randrange(256):02X}:{rng.randrange(256):02X}:{rng.randrange(256):02X}"
+            )
+            scanner.detection_callback(*advertisement(rng, address, cycle))
+            if (current := scanner._adv_data.get(address)) is not None:
+                for client in clients:
+                    if client.name.endswith(f"({address})"):
+                        client.update_from_advertisement(current)
+        if cycle % args.sample_every == 0:
+            # Let background reconnects settle before sampling.
+            await asyncio.sleep(0)
+            samples.append(sample(clients, scanner))
+
+    for client in clients:
+        client.setAutoReconnect(False)
+        async with client.lane():
+            await client.disconnect()
+    await asyncio.sleep(0)
+    final = sample(clients, scanner)
+    tracemalloc.stop()
+
+    skip = len(samples) // 10
+    steady = samples[skip:]
+    failures = [key for key in steady[0] if grown(steady, key)] if len(steady) >= 3 else []
+    if final["open_links"] or final["subscriptions"]:
+        failures.append("links left open")
+    print(
+        json.dumps(
+            {
+                "cycles": args.cycles,
+                "commands": stats,
+                "first": steady[0] if steady else None,
+                "last": steady[-1] if steady else None,
+                "final": final,
+                "failures": failures,
+            },
+            indent=2,
+        )
+    )
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--cycles", type=int, default=2000)
+    parser.add_argument("--advertisements", type=int, default=20, help="per cycle")
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--notify-failure-rate", type=float, default=0.02)
+    parser.add_argument("--connect-failure-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    import logging
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.CRITICAL)
+    return asyncio.run(soak(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""Tests for the MicroBot client against simulated devices."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts"))
+
+import fakeble  # noqa: E402
+
+fakeble.install()
+
+from custom_components.microbot_push import api  # noqa: E402
+
+ADDRESS = "AA:BB:CC:DD:00:01"
+
+
+@pytest.fixture(autouse=True)
+def _fast_acks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(api, "ACK_TIMEOUT", 0.1)
+    monkeypatch.setattr(fakeble.FakeBleakClient, "profile", fakeble.LinkProfile())
+
+
+def _client(tmp_path, address: str = ADDRESS, config: str | None = None, **sections: str) -> api.MicroBotApiClient:
+    bdaddr = address.lower().replace(":", "")
+    path = config or api.token_path(str(tmp_path), address)
+    if not os.path.exists(path):
+        with open(path, "w") as file:
+            file.write(f"[tokens]\n{bdaddr} = {'0' * 32}\n")
+            for section, body in sections.items():
+                file.write(f"[{section}]\n{body.format(bdaddr=bdaddr)}\n")
+    return api.MicroBotApiClient(
+        device=fakeble.FakeBLEDevice(address), config=path, retry_count=0
+    )
+
+
+def _link(client: api.MicroBotApiClient) -> fakeble.FakeBleakClient:
+    return client._client
+
+
+NO_RESPONSE = "{bdaddr}_write_mode = no_response\n{bdaddr}_firmware = 1.0.0"
+
+
+def test_probe_chooses_acknowledged_writes_when_values_are_ignored(tmp_path) -> None:
+    fakeble.FakeBleakClient.profile = fakeble.LinkProfile(
+        ignore_unacknowledged_values=True, ack_delay=0.02
+    )
+
+    async def _test() -> tuple[str | None, bool]:
+        client = _client(tmp_path)
+        await client.connect()
+        ok = await client.push_on()
+        await client.disconnect()
+        return client.write_mode, ok
+
+    assert asyncio.run(_test()) == (api.WRITE_MODE_RESPONSE, True)
+
+
+def test_probe_chooses_unacknowledged_writes(tmp_path) -> None:
+    async def _test() -> tuple[str | None, bool]:
+        client = _client(tmp_path)
+        await client.connect()
+        ok = await client.push_on()
+        await client.disconnect()
+        return client.write_mode, ok
+
+    assert asyncio.run(_test()) == (api.WRITE_MODE_NO_RESPONSE, True)
+
+
+def test_header_notification_is_not_taken_for_the_value(tmp_path) -> None:
+    async def _test() -> tuple[bool, int]:
+        client = _client(tmp_path, capabilities=NO_RESPONSE)
+        await client.connect()
+        writes = _link(client).writes
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(
+            ignore_unacknowledged_values=True, ack_delay=0.02
+        )
+        ok = await client.push_on()
+        return ok, _link(client).writes - writes
+
+    # Only the header reached the device.
+    assert asyncio.run(_test()) == (False, 1)
+
+
+def test_late_notification_from_an_earlier_command_is_ignored(tmp_path) -> None:
+    async def _test() -> bool:
+        client = _client(tmp_path, capabilities=NO_RESPONSE)
+        await client.connect()
+        ack = client._expect_ack(b"\x12\x34", frames=2)
+        # Answers for another command, then for the header only.
+        await client.notification_handler2(0, bytearray(b"\x99\x99\x01\x00"))
+        await client.notification_handler2(0, bytearray(b"\x12\x34\x01\x00"))
+        return await client._wait_ack(ack)
+
+    assert asyncio.run(_test()) is False
+
+
+def test_settings_of_another_device_are_ignored(tmp_path) -> None:
+    config = str(tmp_path / "microbot.conf")
+    other = "AA:BB:CC:DD:00:02"
+    with open(config, "w") as file:
+        file.write("[tokens]\n")
+        for address in (ADDRESS, other):
+            file.write(f"{address.lower().replace(':', '')} = {'0' * 32}\n")
+
+    async def _test() -> tuple[bool, bool, int]:
+        calibrated = _client(tmp_path, other, config=config)
+        calibrated.setDepth(80)
+        await calibrated.connect()
+        assert await calibrated.calibrate()
+        await calibrated.disconnect()
+        client = _client(tmp_path, config=config)
+        await client.connect()
+        writes = _link(client).writes
+        assert await client.push_on()
+        return client.hasToken(), client.is_calibrated, _link(client).writes - writes
+
+    # Only the push frame pair goes out.
+    assert asyncio.run(_test()) == (True, False, 2)
+
+
+def test_overrides_need_calibration(tmp_path) -> None:
+    async def _test() -> None:
+        client = _client(tmp_path)
+        await client.connect()
+        with pytest.raises(api.NotCalibratedError):
+            await client.push_on(depth=80)
+
+    asyncio.run(_test())
+
+
+def test_overrides_are_restored_on_the_next_push(tmp_path) -> None:
+    settings = "{bdaddr}_mode = 0\n{bdaddr}_depth = 50\n{bdaddr}_duration = 0"
+
+    async def _test() -> list[int]:
+        client = _client(tmp_path, settings=settings)
+        await client.connect()
+        writes = []
+        for depth in (None, 80, None, None):
+            before = _link(client).writes
+            assert await client.push_on(depth=depth)
+            writes.append(_link(client).writes - before)
+        return writes
+
+    # Depth is unknown at first, then set, then restored.
+    assert asyncio.run(_test()) == [6, 4, 4, 2]
+
+
+def _adv(counter: int, battery: int = 90) -> bytes:
+    return bytes([0x01, counter % 256, battery])
+
+
+def _learned() -> api.PressDetector:
+    """A detector that has seen the echoes of three pushes."""
+    detector = api.PressDetector()
+    detector.update(_adv(0))
+    for counter in range(1, api.PRESS_LEARN_PUSHES + 1):
+        detector.command_sent(push=True)
+        # The battery byte changes in some echoes but not in every one.
+        detector.update(_adv(counter, battery=90 - counter % 2))
+    return detector
+
+
+def test_press_offsets_are_learned_from_push_echoes() -> None:
+    assert _learned().press_offsets == [1]
+
+
+def test_no_presses_reported_before_learning() -> None:
+    detector = api.PressDetector()
+    detector.update(_adv(0))
+    assert detector.update(_adv(1)) == 0
+    assert detector.press_offsets == []
+
+
+def test_press_on_the_device_is_reported() -> None:
+    detector = _learned()
+    counter = api.PRESS_LEARN_PUSHES
+    assert detector.update(_adv(counter + 1)) == 1
+    assert detector.update(_adv(counter + 3)) == 2
+
+
+def test_unrelated_changes_are_ignored() -> None:
+    detector = _learned()
+    assert detector.update(_adv(api.PRESS_LEARN_PUSHES, battery=40)) == 0
+
+
+def test_late_echo_of_our_push_is_not_a_press() -> None:
+    detector = _learned()
+    counter = api.PRESS_LEARN_PUSHES
+    detector.update(_adv(counter))
+    detector.command_sent(push=True)
+    # The device advertises unchanged data for a while before the echo.
+    for _ in range(5):
+        assert detector.update(_adv(counter)) == 0
+    assert detector.update(_adv(counter + 1)) == 0
+    assert detector.update(_adv(counter + 2)) == 1
+
+
+def test_unanswered_push_stops_hiding_presses() -> None:
+    detector = _learned()
+    counter = api.PRESS_LEARN_PUSHES
+    detector.update(_adv(counter), now=0)
+    detector.command_sent(push=True, now=0)
+    # The timeout runs from the link going down.
+    detector.link_down(now=10)
+    assert detector.update(_adv(counter), now=5 + api.PRESS_ECHO_TIMEOUT) == 0
+    assert detector.update(_adv(counter), now=11 + api.PRESS_ECHO_TIMEOUT) == 0
+    assert detector.update(_adv(counter + 1), now=12 + api.PRESS_ECHO_TIMEOUT) == 1
+
+
+def test_echo_within_the_timeout_is_not_a_press() -> None:
+    detector = _learned()
+    counter = api.PRESS_LEARN_PUSHES
+    detector.update(_adv(counter), now=0)
+    detector.command_sent(push=True, now=0)
+    detector.link_down(now=10)
+    assert detector.update(_adv(counter + 1), now=9 + api.PRESS_ECHO_TIMEOUT) == 0
+
+
+def test_token_handshake_is_not_taken_for_an_echo(tmp_path) -> None:
+    async def _test() -> int:
+        client = _client(tmp_path)
+        client._presses = _learned()
+        counter = api.PRESS_LEARN_PUSHES
+        await client.connect()
+        await client.disconnect()
+        advertisement = api.MicroBotAdvertisement(
+            ADDRESS,
+            {"manufacturer_data_1280": _adv(counter + 1)},
+            fakeble.FakeBLEDevice(ADDRESS),
+        )
+        return client.update_from_advertisement(advertisement)
+
+    assert asyncio.run(_test()) == 1
+
+
+def test_concurrent_loads_read_the_file_once(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    reads = []
+
+    async def _test() -> bool:
+        client = _client(tmp_path)
+        load = client._MicroBotApiClient__loadToken
+
+        def _counted() -> None:
+            reads.append(1)
+            load()
+
+        monkeypatch.setattr(client, "_MicroBotApiClient__loadToken", _counted)
+        await asyncio.gather(client.async_load(), client.connect(), client.async_load())
+        await client.async_load()
+        return client.hasToken()
+
+    assert asyncio.run(_test()) is True
+    assert len(reads) == 1
+
+
+def test_connect_waits_are_counted_per_device(tmp_path) -> None:
+    async def _test() -> tuple[int, int]:
+        lock = api.PriorityLock()
+        clients = [
+            api.MicroBotApiClient(
+                device=fakeble.FakeBLEDevice(f"AA:BB:CC:DD:00:0{i}"),
+                config=str(tmp_path / f"{i}.conf"),
+                retry_count=0,
+                connect_lock=lock,
+            )
+            for i in range(3)
+        ]
+        await asyncio.gather(*(client.connect() for client in clients))
+        stats = clients[0].lane_stats
+        return stats["connect"]["interactive"]["count"], stats["connect_shared"]["interactive"]["count"]
+
+    assert asyncio.run(_test()) == (1, 3)
+
+
+def test_link_drop_fails_the_write_at_once(tmp_path) -> None:
+    async def _test() -> tuple[bool, float, bool]:
+        client = _client(tmp_path)
+        await client.connect()
+        assert client.is_ready()
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(drop_rate=1.0, write_delay=5)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        ok = await client.push_on()
+        return ok, loop.time() - start, client.is_ready()
+
+    ok, elapsed, ready = asyncio.run(_test())
+    assert (ok, ready) == (False, False)
+    # Not the six seconds the dropped write would take.
+    assert elapsed < 1
+
+
+def test_lost_link_raises_link_lost(tmp_path) -> None:
+    async def _test() -> None:
+        client = _client(tmp_path)
+        await client.connect()
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(drop_rate=1.0, write_delay=5)
+        with pytest.raises(api.LinkLostError):
+            await client._write(bytearray(20))
+        with pytest.raises(api.LinkLostError):
+            await client._write(bytearray(20))
+
+    asyncio.run(_test())
+
+
+def test_dropped_link_is_reconnected_once(tmp_path) -> None:
+    async def _test() -> tuple[int, bool]:
+        client = _client(tmp_path)
+        client.setAutoReconnect(True)
+        await client.connect()
+        links = list(fakeble.FakeBleakClient.instances)
+        _link(client)._drop()
+        assert not client.is_ready()
+        task = client._reconnect_task
+        # A second callback for the same link doesn't start another reconnect.
+        client._on_disconnect(links[-1])
+        assert client._reconnect_task is task
+        await task
+        new = [link for link in fakeble.FakeBleakClient.instances if link not in links]
+        return len(new), client.is_ready()
+
+    fakeble.FakeBleakClient.instances.clear()
+    assert asyncio.run(_test()) == (1, True)
+
+
+def test_no_reconnect_unless_enabled_or_after_disconnect(tmp_path) -> None:
+    async def _test() -> tuple[object, object]:
+        client = _client(tmp_path)
+        await client.connect()
+        _link(client)._drop()
+        dropped = client._reconnect_task
+        client.setAutoReconnect(True)
+        await client.connect()
+        await client.disconnect()
+        await asyncio.sleep(0)
+        return dropped, client._reconnect_task
+
+    assert asyncio.run(_test()) == (None, None)
+
+
+def _capabilities(path: str) -> dict[str, str]:
+    import configparser
+
+    config = configparser.ConfigParser()
+    config.read(path)
+    return dict(config["capabilities"]) if config.has_section("capabilities") else {}
+
+
+def test_refused_unacknowledged_writes_fall_back_when_probing(tmp_path) -> None:
+    fakeble.FakeBleakClient.profile = fakeble.LinkProfile(reject_unacknowledged_writes=True)
+
+    async def _test() -> tuple[bool, str | None, bool]:
+        client = _client(tmp_path)
+        await client.connect()
+        ready = client.is_ready()
+        ok = await client.push_on()
+        return ready, client.write_mode, ok
+
+    assert asyncio.run(_test()) == (True, api.WRITE_MODE_RESPONSE, True)
+    bdaddr = ADDRESS.lower().replace(":", "")
+    assert _capabilities(api.token_path(str(tmp_path), ADDRESS))[f"{bdaddr}_write_mode"] == api.WRITE_MODE_RESPONSE
+
+
+def test_refused_unacknowledged_writes_fall_back_after_probing(tmp_path) -> None:
+    async def _test() -> tuple[bool, str | None]:
+        client = _client(tmp_path, capabilities=NO_RESPONSE)
+        await client.connect()
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(reject_unacknowledged_writes=True)
+        ok = await client.push_on()
+        return ok, client.write_mode
+
+    assert asyncio.run(_test()) == (True, api.WRITE_MODE_RESPONSE)
+
+
+def test_failed_connect_keeps_the_known_firmware(tmp_path) -> None:
+    bdaddr = ADDRESS.lower().replace(":", "")
+
+    async def _test() -> tuple[bool, str | None]:
+        client = _client(tmp_path, capabilities=NO_RESPONSE)
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(connect_failure_rate=1.0)
+        await client.connect()
+        connected = client.is_connected()
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile(firmware_read_fails=True)
+        await client.connect()
+        assert client.is_ready()
+        await client.disconnect()
+        fakeble.FakeBleakClient.profile = fakeble.LinkProfile()
+        await client.connect()
+        return connected, client.write_mode
+
+    # No probe, the stored write mode still matches the firmware.
+    assert asyncio.run(_test()) == (False, api.WRITE_MODE_NO_RESPONSE)
+    assert _capabilities(api.token_path(str(tmp_path), ADDRESS)) == {
+        f"{bdaddr}_write_mode": api.WRITE_MODE_NO_RESPONSE,
+        f"{bdaddr}_firmware": "1.0.0",
+    }
+
+
+def test_clients_sharing_a_file_keep_each_others_entries(tmp_path) -> None:
+    import configparser
+
+    config = str(tmp_path / "microbot.conf")
+    addresses = [f"AA:BB:CC:DD:01:{i:02X}" for i in range(8)]
+    with open(config, "w") as file:
+        file.write("[tokens]\n")
+        for address in addresses:
+            file.write(f"{address.lower().replace(':', '')} = {'0' * 32}\n")
+
+    async def _test() -> None:
+        lock = api.PriorityLock()
+        clients = [
+            api.MicroBotApiClient(
+                device=fakeble.FakeBLEDevice(address), config=config, retry_count=0, connect_lock=lock
+            )
+            for address in addresses
+        ]
+        # Each connect probes the write mode and stores it.
+        await asyncio.gather(*(client.connect() for client in clients))
+        assert all(client.is_ready() for client in clients)
+        assert all(await asyncio.gather(*(client.calibrate() for client in clients)))
+
+    asyncio.run(_test())
+    parser = configparser.ConfigParser()
+    parser.read(config)
+    bdaddrs = [address.lower().replace(":", "") for address in addresses]
+    assert sorted(parser["tokens"]) == sorted(bdaddrs)
+    assert len(parser["capabilities"]) == 2 * len(addresses)
+    assert len(parser["settings"]) == 3 * len(addresses)
+    assert os.listdir(tmp_path) == ["microbot.conf"]
+    assert os.stat(config).st_mode & 0o777 == 0o600
@@ -0,0 +1,84 @@
+"""Tests for the fleet command scripts."""
+from __future__ import annotations
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "scripts"))
+
+import fakeble  # noqa: E402
+
+fakeble.install()
+
+from custom_components.microbot_push import api  # noqa: E402
+from custom_components.microbot_push.fleet import (  # noqa: E402
+    Command,
+    MicroBotFleet,
+    ScriptError,
+    parse_script,
+)
+
+ADDRESS = "AA:BB:CC:DD:00:01"
+
+
+def test_commands_and_aliases_are_parsed() -> None:
+    script = f"""
+        # Morning routine
+        {ADDRESS} on
+        * off  # every bot with a token
+        {ADDRESS} calibrate 80 2 invert
+        {ADDRESS} sequence push wait:1.5 off
+    """
+    assert parse_script(script.splitlines()) == [
+        Command(ADDRESS, "push_on"),
+        Command("*", "push_off"),
+        Command(ADDRESS, "calibrate", ["80", "2", "invert"]),
+        Command(ADDRESS, "sequence", ["push_on", "wait:1.5", "push_off"]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        f"{ADDRESS}",
+        f"{ADDRESS} jump",
+        f"{ADDRESS} push_on now",
+        f"{ADDRESS} calibrate 80 2",
+        f"{ADDRESS} calibrate 80 2 bogus",
+        f"{ADDRESS} calibrate 101 2 normal",
+        f"{ADDRESS} calibrate -1 2 normal",
+        f"{ADDRESS} calibrate 80 1000000 normal",
+        f"{ADDRESS} calibrate 80 two normal",
+        f"{ADDRESS} sequence",
+        f"{ADDRESS} sequence push_on jump",
+        f"{ADDRESS} sequence push_on wait:x",
+        f"{ADDRESS} sequence push_on wait:-1",
+        f"{ADDRESS} sequence push_on wait:nan",
+    ],
+)
+def test_malformed_lines_are_rejected(line: str) -> None:
+    with pytest.raises(ScriptError, match="line 2"):
+        parse_script([f"{ADDRESS} push_on", line])
+
+
+def test_commands_are_not_sent_without_the_token(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    with open(api.token_path(str(tmp_path), ADDRESS), "w") as file:
+        file.write(f"[tokens]\n{ADDRESS.lower().replace(':', '')} = {'0' * 32}\n")
+
+    async def _rejected(self, init) -> None:
+        """The link comes up but the token handshake fails."""
+
+    monkeypatch.setattr(api.MicroBotApiClient, "_MicroBotApiClient__setToken", _rejected)
+
+    async def _test() -> list:
+        fleet = MicroBotFleet(token_dir=str(tmp_path), retry_count=0)
+        fleet.bots[ADDRESS] = api.MicroBotAdvertisement(
+            ADDRESS, {}, fakeble.FakeBLEDevice(ADDRESS)
+        )
+        await fleet.client(ADDRESS).async_load()
+        return [result async for result in fleet.run([Command(ADDRESS, "push_on")])]
+
+    [result] = asyncio.run(_test())
+    assert (result.ok, result.error) == (False, "connect failed")
@@ -0,0 +1,221 @@
+"""Tests for the MicroBot priority lanes."""
+from __future__ import annotations
+import asyncio
+
+import pytest
+
+from custom_components.microbot_push.scheduler import Priority, PriorityLock
+
+
+async def _queue(lock: PriorityLock, order: list[str], name: str, priority: Priority) -> asyncio.Task:
+    """Start a waiter that records when it gets the lock."""
+
+    async def _run() -> None:
+        async with lock.hold(priority):
+            order.append(name)
+
+    task = asyncio.ensure_future(_run())
+    await asyncio.sleep(0)
+    return task
+
+
+def test_priority_order() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire(Priority.MAINTENANCE)
+        tasks = [
+            await _queue(lock, order, "maintenance", Priority.MAINTENANCE),
+            await _queue(lock, order, "automation", Priority.AUTOMATION),
+            await _queue(lock, order, "interactive", Priority.INTERACTIVE),
+        ]
+        lock.release()
+        await asyncio.gather(*tasks)
+        assert not lock.locked()
+        return order
+
+    assert asyncio.run(_test()) == ["interactive", "automation", "maintenance"]
+
+
+def test_fifo_within_priority() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire()
+        tasks = [
+            await _queue(lock, order, str(i), Priority.AUTOMATION) for i in range(5)
+        ]
+        lock.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(_test()) == ["0", "1", "2", "3", "4"]
+
+
+def test_cancelled_waiter_is_skipped() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire()
+        first = await _queue(lock, order, "first", Priority.INTERACTIVE)
+        second = await _queue(lock, order, "second", Priority.AUTOMATION)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not lock.has_waiter_above(Priority.AUTOMATION)
+        lock.release()
+        await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert not lock.locked()
+        return order
+
+    assert asyncio.run(_test()) == ["second"]
+
+
+def test_cancelled_after_release_skipped_it() -> None:
+    """A release that skips a cancelled waiter must not break its cleanup."""
+
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire()
+        first = await _queue(lock, order, "first", Priority.INTERACTIVE)
+        second = await _queue(lock, order, "second", Priority.AUTOMATION)
+        first.cancel()
+        lock.release()
+        await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert not lock.locked()
+        return order
+
+    assert asyncio.run(_test()) == ["second"]
+
+
+def test_cancelled_after_handoff_passes_lock_on() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire()
+        first = await _queue(lock, order, "first", Priority.INTERACTIVE)
+        second = await _queue(lock, order, "second", Priority.AUTOMATION)
+        # Hand the lock to the first waiter, then cancel it before it runs.
+        lock.release()
+        first.cancel()
+        await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert not lock.locked()
+        return order
+
+    assert asyncio.run(_test()) == ["second"]
+
+
+def test_checkpoint_yields_to_more_urgent() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire(Priority.MAINTENANCE)
+        assert not await lock.checkpoint(Priority.MAINTENANCE)
+        same = await _queue(lock, order, "maintenance", Priority.MAINTENANCE)
+        assert not await lock.checkpoint(Priority.MAINTENANCE)
+        urgent = await _queue(lock, order, "interactive", Priority.INTERACTIVE)
+        assert await lock.checkpoint(Priority.MAINTENANCE)
+        order.append("holder")
+        lock.release()
+        await asyncio.gather(same, urgent)
+        assert not lock.locked()
+        return order
+
+    # Waiters at the holder's own priority still wait for it to finish.
+    assert asyncio.run(_test()) == ["interactive", "holder", "maintenance"]
+
+
+def test_checkpoint_cancelled_still_holds() -> None:
+    async def _test() -> list[str]:
+        lock = PriorityLock()
+        order: list[str] = []
+        gate = asyncio.Event()
+        queued = asyncio.Event()
+        yielding = asyncio.Event()
+
+        async def _holder() -> None:
+            async with lock.hold(Priority.MAINTENANCE):
+                order.append("holder")
+                await queued.wait()
+                yielding.set()
+                await lock.checkpoint(Priority.MAINTENANCE)
+                order.append("not reached")
+
+        async def _urgent() -> None:
+            async with lock.hold(Priority.INTERACTIVE):
+                await gate.wait()
+                order.append("interactive")
+
+        await lock.acquire()
+        holder = asyncio.ensure_future(_holder())
+        await asyncio.sleep(0)
+        lock.release()
+        await asyncio.sleep(0)
+        urgent = asyncio.ensure_future(_urgent())
+        await asyncio.sleep(0)
+        queued.set()
+        await yielding.wait()
+        await asyncio.sleep(0)
+        # The urgent waiter has the lock, the holder waits to get it back.
+        holder.cancel()
+        await asyncio.sleep(0)
+        assert not holder.done()
+        gate.set()
+        await urgent
+        with pytest.raises(asyncio.CancelledError):
+            await holder
+        assert not lock.locked()
+        await (await _queue(lock, order, "later", Priority.AUTOMATION))
+        return order
+
+    assert asyncio.run(_test()) == ["holder", "interactive", "later"]
+
+
+def test_wait_stats() -> None:
+    async def _test() -> PriorityLock:
+        lock = PriorityLock()
+        order: list[str] = []
+        await lock.acquire()
+        waiter = await _queue(lock, order, "automation", Priority.AUTOMATION)
+        await asyncio.sleep(0.01)
+        lock.release()
+        await waiter
+        return lock
+
+    stats = asyncio.run(_test()).stats_as_dict()
+    assert stats["interactive"]["count"] == 1
+    assert stats["automation"]["count"] == 1
+    assert stats["automation"]["max_wait"] >= 0.01
+    assert stats["maintenance"]["count"] == 0
+
+
+def test_limit_allows_several_holders() -> None:
+    async def _test() -> tuple[int, list[str]]:
+        lock = PriorityLock(limit=2)
+        order: list[str] = []
+        await lock.acquire()
+        await lock.acquire()
+        assert lock.locked()
+        low = await _queue(lock, order, "automation", Priority.AUTOMATION)
+        high = await _queue(lock, order, "interactive", Priority.INTERACTIVE)
+        lock.release()
+        await asyncio.gather(high, low)
+        # One of the first two holders is still running.
+        assert not lock.locked()
+        await lock.acquire()
+        assert lock.locked()
+        lock.release()
+        lock.release()
+        with pytest.raises(RuntimeError):
+            lock.release()
+        return lock.limit, order
+
+    assert asyncio.run(_test()) == (2, ["interactive", "automation"])
+    with pytest.raises(ValueError):
+        PriorityLock(limit=0)
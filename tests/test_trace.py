@@ -0,0 +1,71 @@
+"""Tests for command trace recording."""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+
+import pytest
+
+from custom_components.microbot_push.trace import TraceRecorder, TraceRow, read_trace
+
+ADDRESS = "AA:BB:CC:DD:00:01"
+
+
+def test_recorded_commands_read_back(tmp_path) -> None:
+    path = str(tmp_path / "trace.csv")
+
+    async def _test() -> None:
+        recorder = TraceRecorder(path)
+        recorder.record(ADDRESS, "push_on", "interactive", 10.0, 10.25, 11.5, True)
+        await recorder.async_flush()
+        recorder.record(ADDRESS, "calibrate", "maintenance", 20.0, 20.0, 23.0, False)
+        await recorder.async_flush()
+
+    before = time.time()
+    asyncio.run(_test())
+    rows = list(read_trace(path))
+    assert [
+        (row.address, row.command, row.priority, row.queued, row.latency, row.ok)
+        for row in rows
+    ] == [
+        (ADDRESS, "push_on", "interactive", 0.25, 1.25, True),
+        (ADDRESS, "calibrate", "maintenance", 0.0, 3.0, False),
+    ]
+    # Stamped with when the command started.
+    assert before - 3.1 <= rows[1].time <= time.time()
+    assert all(isinstance(row, TraceRow) for row in rows)
+
+
+def test_flushes_never_overlap(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = str(tmp_path / "trace.csv")
+    active = []
+    overlapped = []
+    lock = threading.Lock()
+
+    async def _test() -> None:
+        recorder = TraceRecorder(path, flush_size=10)
+        append = recorder._append
+
+        def _slow_append(rows: list[tuple]) -> None:
+            with lock:
+                active.append(1)
+                overlapped.append(len(active) > 1)
+            time.sleep(0.05)
+            append(rows)
+            with lock:
+                active.pop()
+
+        monkeypatch.setattr(recorder, "_append", _slow_append)
+        for index in range(25):
+            recorder.record(ADDRESS, "push_on", "automation", index, index, index + 1, True)
+            if index == 9:
+                # Let the size triggered flush start writing.
+                await asyncio.sleep(0.01)
+        # It is still writing when the entry unloads.
+        await asyncio.gather(recorder.async_flush(), recorder._flushing)
+
+    asyncio.run(_test())
+    assert not any(overlapped)
+    assert len(list(read_trace(path))) == 25
+    with open(path) as file:
+        assert file.read().count("time,address") == 1
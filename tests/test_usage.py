@@ -0,0 +1,57 @@
+"""Tests for the usage histogram."""
+from __future__ import annotations
+from datetime import datetime, timedelta
+
+from custom_components.microbot_push.usage import UsageHistogram
+
+MONDAY = datetime(2024, 1, 1, 7, 5)
+
+
+def test_recent_commands_make_a_slot_likely() -> None:
+    usage = UsageHistogram(threshold=1.5)
+    usage.record(MONDAY)
+    assert not usage.likely(MONDAY)
+    usage.record(MONDAY + timedelta(minutes=5))
+    assert usage.likely(MONDAY + timedelta(minutes=9))
+    # Same time of day on another weekday, and the next slot.
+    assert not usage.likely(MONDAY + timedelta(days=1))
+    assert not usage.likely(MONDAY + timedelta(minutes=10))
+
+
+def test_weights_decay_with_the_half_life() -> None:
+    usage = UsageHistogram(half_life=timedelta(days=7))
+    usage.record(MONDAY)
+    usage.record(MONDAY)
+    assert usage.weight(MONDAY + timedelta(days=7)) == 1.0
+    assert not usage.likely(MONDAY + timedelta(days=7))
+    usage.record(MONDAY + timedelta(days=7))
+    assert usage.weight(MONDAY + timedelta(days=7)) == 2.0
+
+
+def test_slot_end() -> None:
+    usage = UsageHistogram(slot_minutes=15)
+    assert usage.slot_end(datetime(2024, 1, 1, 7, 14, 59, 1)) == datetime(2024, 1, 1, 7, 15)
+    assert usage.slot_end(datetime(2024, 1, 1, 7, 15)) == datetime(2024, 1, 1, 7, 30)
+    assert usage.slot_end(datetime(2024, 1, 1, 23, 50)) == datetime(2024, 1, 2, 0, 0)
+
+
+def test_saved_histogram_is_restored() -> None:
+    usage = UsageHistogram()
+    usage.record(MONDAY)
+    usage.record(MONDAY)
+    restored = UsageHistogram()
+    restored.load(usage.as_dict())
+    assert restored.likely(MONDAY)
+
+
+def test_malformed_data_is_ignored() -> None:
+    saved = UsageHistogram().as_dict()
+    for weights in (None, [[0.0] * 96] * 6, [[0.0] * 95] * 7, [["x"] * 96] * 7):
+        usage = UsageHistogram()
+        usage.load({**saved, "weights": weights})
+        usage.record(MONDAY)
+        assert usage.weight(MONDAY) == 1.0
+    usage = UsageHistogram()
+    usage.load({**saved, "updated": "yesterday"})
+    usage.record(MONDAY)
+    assert usage.weight(MONDAY) == 1.0